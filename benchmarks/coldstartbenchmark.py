@@ -0,0 +1,147 @@
+'''
+    Time to first successful score of a newly started scoring service.
+
+    Read the function loadArguments() to determine what parameters to pass in.
+
+    Flow:
+        1. Start the service, either rtslocalservice.py with the scoring script's
+            model load settings for each scenario, or any command given with
+            -command (i.e. docker run of the scoring image) with its URL in -u.
+        2. From the moment it is started, POST a record to it every -poll_ms until
+            it answers (listening) and until it answers with a score rather than
+            an error (first score).
+        3. Time the call that returned the first score and the calls after it, so
+            warm-up left to the first callers shows up, and read the init timings
+            from GET /status when the service has it.
+
+    Run from the repository root:
+        python benchmarks/coldstartbenchmark.py
+        python benchmarks/coldstartbenchmark.py -command "docker run --rm -p 8080:5001 [image]" -u http://127.0.0.1:8080/score
+'''
+import sys
+import os
+import argparse
+import json
+import shlex
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from loadgenbenchmark import ROOT
+
+# [name, scoring environment variables]
+SCENARIOS = [
+    ["eager", {"SCORING_MODEL_LOAD" : "eager", "SCORING_WARMUP_CALLS" : "0"}],
+    ["eager warmup", {"SCORING_MODEL_LOAD" : "eager"}],
+    ["background warmup", {"SCORING_MODEL_LOAD" : "background"}],
+    ["lazy warmup", {"SCORING_MODEL_LOAD" : "lazy"}]
+]
+
+
+def loadArguments(sys_args):
+    '''
+        command = Command that starts the service, empty (default) runs the local
+                  scoring service scenarios.
+        u = URL of the service started by command.
+        k = Endpoint key.
+        load_seconds = Model load time the local scoring script simulates.
+        warmup_calls = Warm-up records the local scoring script scores when a
+                       scenario warms up.
+        after_calls = Calls timed after the first successful score.
+        poll_ms = Time between calls while waiting for the service.
+        timeout = Seconds to wait for a first score.
+        port = Port for the local scoring service.
+    '''
+    parser = argparse.ArgumentParser(description='Cold start benchmark.')
+    parser.add_argument("-command", required=False, default="", type=str, help="Service start command")
+    parser.add_argument("-u", required=False, default="", type=str, help="URL of the started service")
+    parser.add_argument("-k", required=False, default="benchmark", type=str, help="Endpoint key")
+    parser.add_argument("-load_seconds", required=False, default=2, type=float, help="Simulated model load seconds")
+    parser.add_argument("-warmup_calls", required=False, default=1000, type=int, help="Warm-up records")
+    parser.add_argument("-after_calls", required=False, default=20, type=int, help="Calls timed after the first score")
+    parser.add_argument("-poll_ms", required=False, default=10, type=float, help="Milliseconds between calls while waiting")
+    parser.add_argument("-timeout", required=False, default=300, type=float, help="Seconds to wait for a first score")
+    parser.add_argument("-port", required=False, default=8792, type=int, help="Local service port")
+
+    return parser.parse_args(sys_args)
+
+def score(url, key):
+    '''
+        Returns [scored, seconds] of one call, scored is None when nothing answered
+    '''
+    request = urllib.request.Request(
+        url,
+        data = json.dumps({"name" : "coldstart"}).encode("utf-8"),
+        headers = {"Content-Type" : "application/json", "Authorization" : "Bearer " + key})
+    start = time.perf_counter()
+    try:
+        body = urllib.request.urlopen(request, timeout = 60).read().decode("utf-8")
+        return ["GoAway" in body, time.perf_counter() - start]
+    except urllib.error.HTTPError:
+        return [False, time.perf_counter() - start]
+    except Exception:
+        return [None, time.perf_counter() - start]
+
+def measureColdStart(command, environment, url, key, configuration):
+    '''
+        Returns {listening, first_score, first_call, after_p50, after_max, status}
+        in seconds from starting command
+    '''
+    result = {}
+    start = time.perf_counter()
+    service = subprocess.Popen(command, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, cwd = ROOT, env = environment)
+    try:
+        while "first_score" not in result:
+            if time.perf_counter() - start > configuration.timeout:
+                raise Exception("No successful score within {} seconds".format(configuration.timeout))
+            if service.poll() is not None:
+                raise Exception("Service exited with {}".format(service.returncode))
+
+            called = time.perf_counter()
+            scored, seconds = score(url, key)
+            if scored is not None and "listening" not in result:
+                result["listening"] = called - start
+            if scored:
+                result["first_score"] = called + seconds - start
+                result["first_call"] = seconds
+            else:
+                time.sleep(configuration.poll_ms / 1000.0)
+
+        after = sorted([score(url, key)[1] for i in range(configuration.after_calls)])
+        result["after_p50"] = after[len(after) // 2] if after else 0
+        result["after_max"] = after[-1] if after else 0
+
+        try:
+            status_url = url[:url.index("/", url.index("//") + 2)] + "/status"
+            result["status"] = json.loads(urllib.request.urlopen(status_url).read().decode("utf-8"))
+        except Exception:
+            result["status"] = None
+    finally:
+        service.terminate()
+        service.wait()
+    return result
+
+
+if __name__ == "__main__":
+
+    configuration = loadArguments(sys.argv[1:])
+
+    runs = []
+    if configuration.command:
+        runs.append(["command", shlex.split(configuration.command), dict(os.environ), configuration.u])
+    else:
+        url = "http://127.0.0.1:{}/score".format(configuration.port)
+        command = [sys.executable, os.path.join(ROOT, "rtslocalservice.py"), "-port", str(configuration.port), "-k", configuration.k]
+        for name, variables in SCENARIOS:
+            environment = dict(os.environ)
+            environment["SCORING_MODEL_LOAD_SECONDS"] = str(configuration.load_seconds)
+            environment["SCORING_WARMUP_CALLS"] = str(configuration.warmup_calls)
+            environment.update(variables)
+            runs.append([name, command, environment, url])
+
+    print("{:<20}{:>11}{:>13}{:>12}{:>11}{:>11}   {}".format("scenario", "listening", "first score", "first call", "after p50", "after max", "init timings"))
+    for name, command, environment, url in runs:
+        result = measureColdStart(command, environment, url, configuration.k, configuration)
+        timings = json.dumps({key : round(value, 4) for key, value in result["status"]["timings"].items()}) if result["status"] else ""
+        print("{:<20}{:>11.3f}{:>13.3f}{:>12.4f}{:>11.4f}{:>11.4f}   {}".format(
+            name, result["listening"], result["first_score"], result["first_call"], result["after_p50"], result["after_max"], timings))
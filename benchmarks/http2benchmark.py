@@ -0,0 +1,99 @@
+'''
+    HTTP/2 multiplexing compared with pooled HTTP/1.1 against the same endpoint.
+
+    Read the function loadArguments() to determine what parameters to pass in.
+
+    Flow:
+        1. Unless an endpoint is given with -u, start rtslocalservice.py (it needs
+            the h2 package to answer HTTP/2) with the configured added latency.
+        2. For each number of concurrent users run rtsloadtest.py twice on the
+            async engine: HTTP/1.1 with one pooled connection per user, and -http2
+            with every user multiplexed over -h2_connections connections.
+        3. Report throughput, p50/p99/p99.9 latency and the CPU the load generator
+            used for each pair.
+
+    Run from the repository root:
+        python benchmarks/http2benchmark.py
+        python benchmarks/http2benchmark.py -u https://[ingress]/api/v1/service/[name]/score -k [key]
+'''
+import sys
+import os
+import argparse
+import re
+import resource
+import subprocess
+from loadgenbenchmark import ROOT, waitForService
+
+
+def loadArguments(sys_args):
+    '''
+        u = Endpoint to test, empty (default) starts a local scoring service.
+        k = Endpoint key.
+        users = Comma separated numbers of concurrent users to compare at.
+        calls = Calls per user in each run.
+        h2_connections = HTTP/2 connections the users are multiplexed over.
+        port = Port for the local scoring service.
+        latency_ms = Fixed latency added by the local scoring service.
+    '''
+    parser = argparse.ArgumentParser(description='HTTP/2 benchmark.')
+    parser.add_argument("-u", required=False, default="", type=str, help="Endpoint URL")
+    parser.add_argument("-k", required=False, default="benchmark", type=str, help="Endpoint key")
+    parser.add_argument("-users", required=False, default="10,50,200", type=str, help="Concurrent users to compare at")
+    parser.add_argument("-calls", required=False, default=20, type=int, help="Calls per user")
+    parser.add_argument("-h2_connections", required=False, default=4, type=int, help="HTTP/2 connections")
+    parser.add_argument("-port", required=False, default=8791, type=int, help="Local service port")
+    parser.add_argument("-latency_ms", required=False, default=5, type=float, help="Local service added latency")
+
+    return parser.parse_args(sys_args)
+
+def runMode(url, key, users, calls, connections, http2):
+    '''
+        Returns {rps, p50, p99, p99.9, cpu} of one rtsloadtest.py run
+    '''
+    command = [sys.executable, os.path.join(ROOT, "rtsloadtest.py"), "-u", url, "-k", key, "-engine", "async",
+        "-t", str(users), "-i", str(calls), "-connections", str(connections)]
+    if http2:
+        command.append("-http2")
+
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    output = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, cwd = ROOT, check = True).stdout.decode("utf-8")
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    global_stats = output[output.index("Global Stats:"):]
+    result = {}
+    result["rps"] = float(re.search(r"Overall RPS :\s+([\d.]+)", global_stats).group(1))
+    for name in ["p50", "p99", "p99.9"]:
+        result[name] = float(re.search(r"\s{} = ([\d.e-]+)".format(re.escape(name)), global_stats).group(1))
+    result["errors"] = int(re.search(r"errors = (\d+)", global_stats).group(1))
+    result["cpu"] = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return result
+
+
+if __name__ == "__main__":
+
+    configuration = loadArguments(sys.argv[1:])
+
+    service = None
+    url = configuration.u
+    if not url:
+        url = "http://127.0.0.1:{}/score".format(configuration.port)
+        service = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "rtslocalservice.py"), "-port", str(configuration.port), "-k", configuration.k,
+                "-latency", "fixed", "-latency_ms", str(configuration.latency_ms)],
+            stdout = subprocess.DEVNULL,
+            cwd = ROOT)
+
+    try:
+        if service:
+            waitForService("http://127.0.0.1:{}/".format(configuration.port))
+
+        print("{:<8}{:<10}{:>8}{:>10}{:>10}{:>10}{:>10}{:>8}{:>8}".format("users", "mode", "conns", "rps", "p50", "p99", "p99.9", "errors", "cpu"))
+        for users in [int(x) for x in configuration.users.split(",")]:
+            for mode, connections, http2 in [["HTTP/1.1", users, False], ["HTTP/2", configuration.h2_connections, True]]:
+                result = runMode(url, configuration.k, users, configuration.calls, connections, http2)
+                print("{:<8}{:<10}{:>8}{:>10.0f}{:>10.4f}{:>10.4f}{:>10.4f}{:>8}{:>8.2f}".format(
+                    users, mode, connections, result["rps"], result["p50"], result["p99"], result["p99.9"], result["errors"], result["cpu"]))
+    finally:
+        if service:
+            service.terminate()
+            service.wait()
@@ -0,0 +1,109 @@
+'''
+    How much load rtsloadtest.py can generate per core.
+
+    Read the function loadArguments() to determine what parameters to pass in.
+
+    Flow:
+        1. Start rtslocalservice.py with no added latency and enough processes that
+            the service is not the limit.
+        2. Run rtsloadtest.py against it once per scenario (engine, users, connections,
+            processes) as a child process and collect the calls and RPS it reports.
+        3. Measure the CPU time the load generator used with getrusage, and report
+            RPS per core as calls / CPU seconds, along with how many cores it kept busy.
+
+    Run from the repository root:
+        python benchmarks/loadgenbenchmark.py
+'''
+import sys
+import os
+import argparse
+import resource
+import re
+import subprocess
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# [name, rtsloadtest.py arguments], -i is set from -calls
+SCENARIOS = [
+    ["thread t=8", ["-t", "8"]],
+    ["thread t=32", ["-t", "32"]],
+    ["async c=32", ["-engine", "async", "-t", "32", "-connections", "32"]],
+    ["async c=128", ["-engine", "async", "-t", "128", "-connections", "128"]],
+    ["async c=128 p=2", ["-engine", "async", "-t", "128", "-connections", "64", "-processes", "2"]],
+    ["async new conn", ["-engine", "async", "-t", "32", "-connections", "32", "-new_connection"]]
+]
+
+
+def loadArguments(sys_args):
+    '''
+        calls = Calls made in each scenario.
+        port = Port for the local scoring service.
+        service_processes = Local scoring service processes.
+        scenario = Only run scenarios whose name contains this text.
+    '''
+    parser = argparse.ArgumentParser(description='Load generator benchmark.')
+    parser.add_argument("-calls", required=False, default=20000, type=int, help="Calls per scenario")
+    parser.add_argument("-port", required=False, default=8790, type=int, help="Local service port")
+    parser.add_argument("-service_processes", required=False, default=max(os.cpu_count() // 2, 1), type=int, help="Local service processes")
+    parser.add_argument("-scenario", required=False, default="", type=str, help="Scenario name filter")
+
+    return parser.parse_args(sys_args)
+
+def waitForService(url, timeout = 30):
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            urllib.request.urlopen(url).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise Exception("Local scoring service did not start")
+
+def runScenario(url, arguments, calls):
+    '''
+        Returns {calls, seconds, rps, cpu, rps_per_core, cores} for one load test run
+    '''
+    users = int(arguments[arguments.index("-t") + 1])
+    command = [sys.executable, os.path.join(ROOT, "rtsloadtest.py"), "-u", url, "-k", "benchmark", "-i", str(max(calls // users, 1))] + arguments
+
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    output = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, cwd = ROOT, check = True).stdout.decode("utf-8")
+    seconds = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    result = {}
+    result["calls"] = int(re.search(r"calls = (\d+)", output).group(1))
+    result["seconds"] = seconds
+    result["rps"] = float(re.search(r"Overall RPS :\s+([\d.]+)", output).group(1))
+    result["cpu"] = cpu
+    result["rps_per_core"] = result["calls"] / cpu
+    result["cores"] = cpu / seconds
+    return result
+
+
+if __name__ == "__main__":
+
+    configuration = loadArguments(sys.argv[1:])
+    url = "http://127.0.0.1:{}/score".format(configuration.port)
+
+    service = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "rtslocalservice.py"), "-port", str(configuration.port), "-k", "benchmark", "-processes", str(configuration.service_processes)],
+        stdout = subprocess.DEVNULL,
+        cwd = ROOT)
+    try:
+        waitForService("http://127.0.0.1:{}/".format(configuration.port))
+
+        print("{:<18}{:>10}{:>10}{:>10}{:>10}{:>14}{:>8}".format("scenario", "calls", "seconds", "rps", "cpu", "rps/core", "cores"))
+        for name, arguments in SCENARIOS:
+            if configuration.scenario not in name:
+                continue
+            result = runScenario(url, arguments, configuration.calls)
+            print("{:<18}{:>10}{:>10.2f}{:>10.0f}{:>10.2f}{:>14.0f}{:>8.2f}".format(
+                name, result["calls"], result["seconds"], result["rps"], result["cpu"], result["rps_per_core"], result["cores"]))
+    finally:
+        service.terminate()
+        service.wait()
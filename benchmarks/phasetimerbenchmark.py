@@ -0,0 +1,87 @@
+'''
+    Overhead of the scoring script's phase timers on run().
+
+    Read the function loadArguments() to determine what parameters to pass in.
+
+    Flow:
+        1. For each mode (timers off, timers on, timers with the Server-Timing
+            header) load a fresh copy of the scoring script with its environment
+            variables set and call init().
+        2. Call run() in process with the same body calls times, repeat this and
+            keep the fastest repeat so other work on the machine does not count.
+        3. Report microseconds per call and the time and percentage added over
+            timers off.
+
+    Run from the repository root:
+        python benchmarks/phasetimerbenchmark.py
+'''
+import sys
+import os
+import argparse
+import importlib.util
+import json
+import time
+from loadgenbenchmark import ROOT
+
+# [name, scoring environment variables]
+MODES = [
+    ["off", {"SCORING_PHASE_TIMERS" : "0", "SCORING_TIMING_HEADER" : "0"}],
+    ["timers", {"SCORING_PHASE_TIMERS" : "1", "SCORING_TIMING_HEADER" : "0"}],
+    ["timers + header", {"SCORING_PHASE_TIMERS" : "1", "SCORING_TIMING_HEADER" : "1"}]
+]
+
+
+def loadArguments(sys_args):
+    '''
+        scoring = Path to the scoring script.
+        calls = Calls to run() in each repeat.
+        repeats = Repeats per mode, the fastest is reported.
+        records = Records in the body, 1 sends a single record.
+    '''
+    parser = argparse.ArgumentParser(description='Phase timer overhead benchmark.')
+    parser.add_argument("-scoring", required=False, default=os.path.join(ROOT, "paths", "realtime", "scoring", "scoring.py"), type=str, help="Scoring script")
+    parser.add_argument("-calls", required=False, default=50000, type=int, help="Calls per repeat")
+    parser.add_argument("-repeats", required=False, default=5, type=int, help="Repeats per mode")
+    parser.add_argument("-records", required=False, default=1, type=int, help="Records per body")
+
+    return parser.parse_args(sys_args)
+
+def loadScoring(file_name, variables):
+    '''
+        A fresh copy of the scoring script, initialized with variables set
+    '''
+    os.environ.update(variables)
+    spec = importlib.util.spec_from_file_location("scoring", file_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.init()
+    return module
+
+def timeRun(scoring, body, calls, repeats):
+    '''
+        Fastest seconds per call over repeats
+    '''
+    run = scoring.run
+    best = None
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        for call in range(calls):
+            run(body)
+        seconds = (time.perf_counter() - start) / calls
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+if __name__ == "__main__":
+
+    configuration = loadArguments(sys.argv[1:])
+
+    records = [{"name" : "record" + str(i)} for i in range(configuration.records)]
+    body = json.dumps(records if configuration.records > 1 else records[0])
+
+    print("{:<18}{:>12}{:>12}{:>12}".format("mode", "us/call", "added us", "overhead"))
+    baseline = None
+    for name, variables in MODES:
+        seconds = timeRun(loadScoring(configuration.scoring, variables), body, configuration.calls, configuration.repeats)
+        baseline = seconds if baseline is None else baseline
+        print("{:<18}{:>12.2f}{:>12.2f}{:>11.1f}%".format(name, seconds * 1000000, (seconds - baseline) * 1000000, (seconds / baseline - 1) * 100))
@@ -0,0 +1,226 @@
+'''
+    Benchmark of the scoring script in process, no image or service needed.
+
+    Read the function loadArguments() to determine what parameters to pass in.
+
+    Flow:
+        1. For each case, a payload size (characters in each record's name), a
+            batch size (records per call, 1 sends a single record) and a variant,
+            load a fresh copy of the scoring script and call init():
+
+                uncached     - Every call scored
+                cached       - Response cache on, every call after the first is a hit
+                record_error - Every record is missing its name, so each gets an error
+                malformed    - The body is cut short and is not valid JSON
+
+        2. Call run() with the case's body for -seconds, timing every call, -repeats
+            times, and report calls per second and latency percentiles of the 
+            fastest repeat so other work on the machine counts as little as it can.
+        3. Call it -alloc_calls more times with tracemalloc on and report the peak
+            memory allocated during a call.
+        4. Save the results with -save, or compare them with a saved baseline with
+            -baseline. A case that lost more calls per second, or grew its p99 or
+            allocations more, than the thresholds allow fails the comparison and
+            the script exits with 1.
+
+    Run from the repository root:
+        python benchmarks/scoringbenchmark.py -save before.json
+        python benchmarks/scoringbenchmark.py -baseline before.json
+'''
+import sys
+import os
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+from phasetimerbenchmark import ROOT, loadScoring
+
+VARIANTS = ["uncached", "cached", "record_error", "malformed"]
+
+# Environment of every case, so one case's settings do not leak into the next
+ENVIRONMENT = {
+    "SCORING_MODEL_LOAD" : "eager",
+    "SCORING_MODEL_LOAD_SECONDS" : "0",
+    "SCORING_WARMUP_CALLS" : "0",
+    "SCORING_BATCH_MAX_RECORDS" : "1",
+    "SCORING_CACHE_ENTRIES" : "0",
+    "SCORING_PHASE_TIMERS" : "0",
+    "SCORING_TIMING_HEADER" : "0",
+    "SCORING_JSON_CODEC" : "auto"
+}
+
+
+def loadArguments(sys_args):
+    '''
+        scoring = Path to the scoring script.
+        payload_sizes = Comma separated characters in each record's name.
+        batch_sizes = Comma separated records per call, 1 sends a single record.
+        variants = Comma separated variants to run.
+        codec = JSON codec of the scoring script, auto, orjson or json.
+        case = Only run cases whose name contains this text.
+        seconds = Seconds each repeat of a case is timed for.
+        repeats = Repeats of each case, the fastest is reported.
+        alloc_calls = Calls traced for allocations in each case.
+        save = File to save the results to as a baseline.
+        baseline = Saved results to compare with.
+        max_ops_decrease = Allowed decrease in calls per second in percent.
+        max_p99_increase = Allowed increase in p99 latency in percent.
+        max_alloc_increase = Allowed increase in peak allocation per call in percent.
+        A negative threshold turns its check off.
+    '''
+    parser = argparse.ArgumentParser(description='Scoring script benchmark.')
+    parser.add_argument("-scoring", required=False, default=os.path.join(ROOT, "paths", "realtime", "scoring", "scoring.py"), type=str, help="Scoring script")
+    parser.add_argument("-payload_sizes", required=False, default="16,1024", type=str, help="Characters in each record's name")
+    parser.add_argument("-batch_sizes", required=False, default="1,100,1000", type=str, help="Records per call")
+    parser.add_argument("-variants", required=False, default=",".join(VARIANTS), type=str, help="Variants to run")
+    parser.add_argument("-codec", required=False, default="auto", type=str, help="Scoring JSON codec")
+    parser.add_argument("-case", required=False, default="", type=str, help="Case name filter")
+    parser.add_argument("-seconds", required=False, default=0.5, type=float, help="Seconds per repeat")
+    parser.add_argument("-repeats", required=False, default=3, type=int, help="Repeats per case")
+    parser.add_argument("-alloc_calls", required=False, default=20, type=int, help="Calls traced for allocations")
+    parser.add_argument("-save", required=False, default="", type=str, help="Save results to file")
+    parser.add_argument("-baseline", required=False, default="", type=str, help="Baseline results file")
+    parser.add_argument("-max_ops_decrease", required=False, default=20, type=float, help="Allowed ops/sec decrease percent")
+    parser.add_argument("-max_p99_increase", required=False, default=50, type=float, help="Allowed p99 increase percent")
+    parser.add_argument("-max_alloc_increase", required=False, default=10, type=float, help="Allowed allocation increase percent")
+
+    return parser.parse_args(sys_args)
+
+def buildBody(payload_size, batch_size, variant):
+    '''
+        Request body for a case
+    '''
+    field = "nombre" if variant == "record_error" else "name"
+    records = [{field : ("record" + str(i) + "x" * payload_size)[:payload_size]} for i in range(batch_size)]
+    body = json.dumps(records if batch_size > 1 else records[0])
+    if variant == "malformed":
+        body = body[:-1]
+    return body
+
+def percentile(ordered, percent):
+    return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)]
+
+def timeCalls(run, body, seconds):
+    '''
+        Returns [sorted latencies, total seconds] of calling run for seconds
+    '''
+    latencies = []
+    clock = time.perf_counter
+    start = clock()
+    end = start + seconds
+    while True:
+        called = clock()
+        run(body)
+        finished = clock()
+        latencies.append(finished - called)
+        if finished >= end:
+            break
+    total = clock() - start
+    latencies.sort()
+    return [latencies, total]
+
+def benchmarkCase(scoring, body, seconds, repeats, alloc_calls):
+    '''
+        Returns {calls, ops, p50, p90, p99, max, alloc_bytes} for one case,
+        latencies in seconds
+    '''
+    run = scoring.run
+    for call in range(10):
+        run(body)
+
+    latencies, total = max([timeCalls(run, body, seconds) for repeat in range(max(repeats, 1))], key = lambda x: len(x[0]) / x[1])
+
+    '''
+        tracemalloc is restarted for each call so its peak is that call's
+    '''
+    peaks = []
+    for call in range(alloc_calls):
+        tracemalloc.start()
+        current = tracemalloc.get_traced_memory()[0]
+        run(body)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        tracemalloc.stop()
+
+    peaks.sort()
+    result = {}
+    result["calls"] = len(latencies)
+    result["ops"] = len(latencies) / total
+    result["p50"] = percentile(latencies, 50)
+    result["p90"] = percentile(latencies, 90)
+    result["p99"] = percentile(latencies, 99)
+    result["max"] = latencies[-1]
+    result["alloc_bytes"] = peaks[len(peaks) // 2] if peaks else 0
+    return result
+
+def compareCase(result, baseline, configuration):
+    '''
+        Returns [ops change %, p99 change %, alloc change %, failures]
+    '''
+    def change(name):
+        return (result[name] / baseline[name] - 1) * 100 if baseline[name] else 0
+
+    ops, p99, alloc = change("ops"), change("p99"), change("alloc_bytes")
+    failures = []
+    if configuration.max_ops_decrease >= 0 and -ops > configuration.max_ops_decrease:
+        failures.append("ops")
+    if configuration.max_p99_increase >= 0 and p99 > configuration.max_p99_increase:
+        failures.append("p99")
+    if configuration.max_alloc_increase >= 0 and alloc > configuration.max_alloc_increase:
+        failures.append("alloc")
+    return [ops, p99, alloc, failures]
+
+
+if __name__ == "__main__":
+
+    configuration = loadArguments(sys.argv[1:])
+
+    baseline = None
+    if configuration.baseline:
+        with open(configuration.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)["cases"]
+
+    header = "{:<30}{:>10}{:>11}{:>11}{:>11}{:>11}{:>12}".format("case", "calls", "ops/sec", "p50 us", "p90 us", "p99 us", "alloc B")
+    if baseline:
+        header += "{:>9}{:>9}{:>9}  {}".format("ops %", "p99 %", "alloc %", "result")
+    print(header)
+
+    results = {}
+    regressions = 0
+    for payload_size in [int(x) for x in configuration.payload_sizes.split(",")]:
+        for batch_size in [int(x) for x in configuration.batch_sizes.split(",")]:
+            for variant in configuration.variants.split(","):
+                name = "{} b={} s={}".format(variant, batch_size, payload_size)
+                if configuration.case not in name:
+                    continue
+
+                environment = dict(ENVIRONMENT)
+                environment["SCORING_JSON_CODEC"] = configuration.codec
+                if variant == "cached":
+                    environment["SCORING_CACHE_ENTRIES"] = "1000"
+                scoring = loadScoring(configuration.scoring, environment)
+
+                result = benchmarkCase(scoring, buildBody(payload_size, batch_size, variant), configuration.seconds, configuration.repeats, configuration.alloc_calls)
+                results[name] = result
+
+                line = "{:<30}{:>10}{:>11.0f}{:>11.1f}{:>11.1f}{:>11.1f}{:>12.0f}".format(
+                    name, result["calls"], result["ops"], result["p50"] * 1000000, result["p90"] * 1000000, result["p99"] * 1000000, result["alloc_bytes"])
+                if baseline:
+                    if name in baseline:
+                        ops, p99, alloc, failures = compareCase(result, baseline[name], configuration)
+                        regressions += 1 if failures else 0
+                        line += "{:>+9.1f}{:>+9.1f}{:>+9.1f}  {}".format(ops, p99, alloc, "FAIL " + ",".join(failures) if failures else "ok")
+                    else:
+                        line += "{:>9}{:>9}{:>9}  {}".format("", "", "", "not in baseline")
+                print(line)
+
+    if configuration.save:
+        information = {"python" : platform.python_version(), "machine" : platform.machine(), "saved" : time.strftime("%Y-%m-%d %H:%M:%S")}
+        with open(configuration.save, "w") as save_file:
+            json.dump({"information" : information, "cases" : results}, save_file, indent = 4)
+        print("Saved results to", configuration.save)
+
+    if baseline:
+        print("{} of {} cases regressed".format(regressions, len(results)))
+        if regressions:
+            sys.exit(1)
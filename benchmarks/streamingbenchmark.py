@@ -0,0 +1,211 @@
+'''
+    Memory of the scoring script's streaming mode as requests grow.
+
+    Read the function loadArguments() to determine what parameters to pass in.
+
+    Flow:
+        1. Load the scoring script with SCORING_STREAM_CHUNK_RECORDS set to -chunk
+            and call init().
+        2. For each request size, in records, feed scoreStream() newline delimited
+            records from a generator and throw each chunk of results away as it
+            is yielded, as the service writes it out, so the only memory held is
+            the scoring script's own. tracemalloc records the peak.
+        3. For comparison, do the same with run() and the records sent as one JSON
+            array. The body itself is not counted.
+        4. Check the streaming peak stayed flat: the peak at the largest request
+            may be at most -tolerance percent over the peak at the smallest. The
+            script exits with 1 when it is not.
+        5. Unless -no_service is given, start rtslocalservice.py and POST each
+            request as application/x-ndjson, with a line that is not JSON and one
+            that is not UTF-8 on the end, so it goes through run()'s streaming
+            branch. Every record must come back with a result and the two bad
+            lines with an error each, or the script exits with 1. The service's
+            peak resident memory is reported on Linux. The local service reads
+            the body whole, so it grows with the request and is not checked.
+
+    Run from the repository root:
+        python benchmarks/streamingbenchmark.py
+'''
+import sys
+import os
+import argparse
+import http.client
+import json
+import subprocess
+import time
+import tracemalloc
+from loadgenbenchmark import waitForService
+from phasetimerbenchmark import ROOT, loadScoring
+from scoringbenchmark import ENVIRONMENT
+
+
+def loadArguments(sys_args):
+    '''
+        scoring = Path to the scoring script.
+        sizes = Comma separated request sizes in records.
+        chunk = Records the streaming mode scores at a time.
+        codec = JSON codec of the scoring script, auto, orjson or json.
+        tolerance = Allowed growth in percent of the streaming peak from the
+                    smallest to the largest request.
+        no_array = If present, skip the JSON array comparison (it needs memory in
+                   proportion to the largest request).
+        no_service = If present, skip the requests through the local service.
+        port = Port for the local scoring service.
+    '''
+    parser = argparse.ArgumentParser(description='Streaming memory benchmark.')
+    parser.add_argument("-scoring", required=False, default=os.path.join(ROOT, "paths", "realtime", "scoring", "scoring.py"), type=str, help="Scoring script")
+    parser.add_argument("-sizes", required=False, default="1000,10000,100000", type=str, help="Request sizes in records")
+    parser.add_argument("-chunk", required=False, default=500, type=int, help="Streaming chunk size in records")
+    parser.add_argument("-codec", required=False, default="auto", type=str, help="Scoring JSON codec")
+    parser.add_argument("-tolerance", required=False, default=25, type=float, help="Allowed streaming peak growth percent")
+    parser.add_argument("-no_array", required=False, default=False, action="store_true", help="Skip the JSON array comparison")
+    parser.add_argument("-no_service", required=False, default=False, action="store_true", help="Skip the local service requests")
+    parser.add_argument("-port", required=False, default=8793, type=int, help="Local service port")
+
+    return parser.parse_args(sys_args)
+
+def recordLines(records):
+    '''
+        Newline delimited records, generated one at a time
+    '''
+    for i in range(records):
+        yield '{{"name":"record{}"}}\n'.format(i).encode("utf-8")
+
+def streamPeak(scoring, records, chunk):
+    '''
+        Returns [peak bytes, result lines, seconds] of streaming records through
+        scoreStream
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    lines = 0
+    for output in scoring.scoreStream(recordLines(records), chunk):
+        lines += output.count("\n")
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return [peak, lines, seconds]
+
+def arrayPeak(scoring, records):
+    '''
+        Returns [peak bytes, seconds] of scoring records sent as one JSON array
+        with run(), less the body
+    '''
+    body = "[" + ",".join(['{{"name":"record{}"}}'.format(i) for i in range(records)]) + "]"
+    tracemalloc.start()
+    current = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    scoring.run(body)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return [peak, seconds]
+
+def peakResident(pid):
+    '''
+        Peak resident memory of process pid in bytes, None where /proc is not
+        available
+    '''
+    try:
+        with open("/proc/{}/status".format(pid), "r") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return None
+
+def servicePost(port, records):
+    '''
+        Returns [results, errors, seconds] of POSTing records and two bad lines
+        as newline delimited JSON to the local service, reading the response as
+        it streams back
+    '''
+    body = b"".join(recordLines(records)) + b'{"name":\n' + b'{"name":"\xff"}\n'
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout = 600)
+    start = time.perf_counter()
+    connection.request("POST", "/score", body, {"Content-Type" : "application/x-ndjson"})
+    response = connection.getresponse()
+    if response.status != 200:
+        raise Exception("Service answered {} {}".format(response.status, response.read()[:200]))
+
+    results = 0
+    errors = 0
+    for line in response:
+        if "error" in json.loads(line.decode("utf-8")):
+            errors += 1
+        else:
+            results += 1
+    seconds = time.perf_counter() - start
+    connection.close()
+    return [results, errors, seconds]
+
+def checkService(configuration, sizes):
+    '''
+        POST every request size through the local service, True when every 
+        response was complete
+    '''
+    environment = dict(os.environ)
+    environment.update(ENVIRONMENT)
+    environment["SCORING_JSON_CODEC"] = configuration.codec
+    environment["SCORING_STREAM_CHUNK_RECORDS"] = str(configuration.chunk)
+    service = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "rtslocalservice.py"), "-port", str(configuration.port), "-scoring", configuration.scoring],
+        stdout = subprocess.DEVNULL,
+        cwd = ROOT,
+        env = environment)
+
+    passed = True
+    try:
+        waitForService("http://127.0.0.1:{}/".format(configuration.port))
+        print("{:>10}{:>10}{:>10}{:>12}{:>20}".format("records", "results", "errors", "service s", "service peak RSS B"))
+        for records in sizes:
+            results, errors, seconds = servicePost(configuration.port, records)
+            resident = peakResident(service.pid)
+            print("{:>10}{:>10}{:>10}{:>12.3f}{:>20}".format(records, results, errors, seconds, resident if resident else ""))
+            if results != records or errors != 2:
+                print("FAIL expected {} results and 2 errors".format(records))
+                passed = False
+    finally:
+        service.terminate()
+        service.wait()
+    return passed
+
+
+if __name__ == "__main__":
+
+    configuration = loadArguments(sys.argv[1:])
+
+    environment = dict(ENVIRONMENT)
+    environment["SCORING_JSON_CODEC"] = configuration.codec
+    environment["SCORING_STREAM_CHUNK_RECORDS"] = str(configuration.chunk)
+    scoring = loadScoring(configuration.scoring, environment)
+
+    sizes = [int(x) for x in configuration.sizes.split(",")]
+    print("{:>10}{:>16}{:>12}{:>16}{:>12}".format("records", "stream peak B", "stream s", "array peak B", "array s"))
+    peaks = []
+    for records in sizes:
+        peak, lines, seconds = streamPeak(scoring, records, configuration.chunk)
+        if lines != records:
+            raise Exception("Streamed {} records but got {} results".format(records, lines))
+        peaks.append(peak)
+
+        line = "{:>10}{:>16}{:>12.3f}".format(records, peak, seconds)
+        if not configuration.no_array:
+            array_peak, array_seconds = arrayPeak(scoring, records)
+            line += "{:>16}{:>12.3f}".format(array_peak, array_seconds)
+        print(line)
+
+    growth = (peaks[-1] / peaks[0] - 1) * 100
+    print("Streaming peak grew {:.1f}% from the smallest to the largest request, {:.1f}% allowed".format(growth, configuration.tolerance))
+    failed = growth > configuration.tolerance
+    print("FAIL streaming memory is not flat" if failed else "PASS streaming memory is flat")
+
+    if not configuration.no_service:
+        if checkService(configuration, sizes):
+            print("PASS every streamed request through the service was complete")
+        else:
+            failed = True
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,159 @@
+'''
+    Adaptive concurrency, finds how many calls can be in flight while the p99
+    latency stays under a target.
+
+    The controller works in intervals. During an interval every completed call
+    is recorded, at the end of it the interval's p99 latency and error rate
+    set the limit (the number of calls allowed in flight) for the next one.
+
+    The limit starts at the minimum in slow start, doubling after every 
+    interval that meets the SLO, until the first interval that does not. From
+    then on the controller adjusts it:
+
+        aimd     - Additive increase, multiplicative decrease. Under the SLO
+                   the limit grows by 1, over it (or over the error budget)
+                   the limit is cut to 70%.
+        gradient - The limit is scaled by slo_p99 / p99, held between 0.5 and
+                   1.0, and then grows by the square root of the limit. Under
+                   the SLO this grows faster than aimd at high limits, over it
+                   the cut is in proportion to how far the SLO was missed.
+                   The new limit is averaged with the old one so a single noisy
+                   interval does not swing it.
+
+    The controller has the same valueAt(elapsed) method as a LoadProfile
+    (loadtest/profiles.py), so AsyncRun uses it to decide how many of its
+    users are calling at any time.
+
+    The controller has converged once it has missed the SLO twice, so it has
+    backed off from the limit it found in slow start and come back up to it,
+    or when the run ends with at least two passing intervals at the maximum.
+
+    Reported:
+        converged - Whether the controller converged, the settled values are
+                    only reported when it did.
+        settled_concurrency - Median limit of the intervals after the first 
+                              missed SLO, or at the maximum.
+        settled_rps, settled_p99 - Throughput and p99 over those intervals.
+        best_concurrency, best_rps - The interval with the most successful
+                                     calls per second that met the SLO.
+'''
+import math
+from loadtest.histogram import LatencyRecorder
+
+
+class ConcurrencyController:
+    kinds = ["aimd", "gradient"]
+
+    def __init__(self, kind, slo_p99, error_budget, minimum = 1, maximum = 500, interval = 1.0):
+        if kind not in ConcurrencyController.kinds:
+            raise Exception("Unknown concurrency controller " + kind)
+
+        self.kind = kind
+        self.slo_p99 = slo_p99
+        self.error_budget = error_budget
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.interval = interval
+        self.limit = float(self.minimum)
+        self.slow_start = True
+        self.window = LatencyRecorder()
+        self.window_start = None
+        self.intervals = []
+
+    def record(self, status, elapsed):
+        '''
+            Record a completed call
+        '''
+        self.window.record(status, elapsed)
+
+    def valueAt(self, elapsed):
+        '''
+            Number of calls allowed in flight elapsed seconds into the test, the
+            limit is adjusted here whenever an interval has passed.
+        '''
+        if self.window_start is None:
+            self.window_start = elapsed
+        elif elapsed - self.window_start >= self.interval:
+            self._adjust(elapsed)
+        return int(self.limit)
+
+    def _adjust(self, elapsed):
+        window = self.window
+        self.window = LatencyRecorder()
+        seconds = elapsed - self.window_start
+        self.window_start = elapsed
+
+        calls = window.calls()
+        if calls == 0:
+            return
+
+        p99 = window.histogram.percentile(99)
+        error_rate = window.errors / calls
+        passed = p99 <= self.slo_p99 and error_rate <= self.error_budget
+        self.intervals.append({
+            "limit" : int(self.limit),
+            "rps" : window.success / seconds,
+            "p99" : p99,
+            "passed" : passed,
+            "recorder" : window
+        })
+
+        if self.slow_start and passed:
+            limit = self.limit * 2
+        elif self.kind == "aimd":
+            if passed:
+                limit = self.limit + 1
+            else:
+                limit = self.limit * 0.7
+        else:
+            gradient = min(max(self.slo_p99 / p99, 0.5), 1.0) if p99 > 0 else 1.0
+            if not passed and error_rate > self.error_budget:
+                gradient = 0.5
+            limit = self.limit * gradient + (math.sqrt(self.limit) if passed else 0)
+            limit = (self.limit + limit) / 2
+
+        self.slow_start = self.slow_start and passed
+        self.limit = min(max(limit, self.minimum), self.maximum)
+
+    def _settledIntervals(self):
+        '''
+            Intervals after the controller converged, empty if it did not
+        '''
+        missed = [index for index in range(len(self.intervals)) if not self.intervals[index]["passed"]]
+        if len(missed) >= 2:
+            return self.intervals[missed[0] + 1:]
+
+        capped = []
+        for interval in reversed(self.intervals):
+            if not interval["passed"] or interval["limit"] < self.maximum:
+                break
+            capped.append(interval)
+        return capped if len(capped) >= 2 else []
+
+    def getAdaptiveStatistics(self):
+        '''
+            Dictionary of the controller results for reporting
+        '''
+        stats = {}
+        stats["controller"] = self.kind
+        stats["slo_p99"] = self.slo_p99
+        stats["intervals"] = len(self.intervals)
+        stats["final_concurrency"] = int(self.limit)
+
+        settled = self._settledIntervals()
+        stats["converged"] = len(settled) > 0
+        if settled:
+            limits = sorted([x["limit"] for x in settled])
+            recorder = LatencyRecorder()
+            for interval in settled:
+                recorder.merge(interval["recorder"])
+            stats["settled_concurrency"] = limits[len(limits) // 2]
+            stats["settled_rps"] = sum([x["rps"] for x in settled]) / len(settled)
+            stats["settled_p99"] = recorder.histogram.percentile(99)
+
+        passed = [x for x in self.intervals if x["passed"]]
+        if passed:
+            best = max(passed, key = lambda x: x["rps"])
+            stats["best_concurrency"] = best["limit"]
+            stats["best_rps"] = best["rps"]
+        return stats
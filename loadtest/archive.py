@@ -0,0 +1,49 @@
+'''
+    Binary archive of a load test run. 
+
+    A run is saved as a compressed NumPy .npz file holding the raw result 
+    columns (see loadtest/results.py) and, as JSON, the arguments the run was
+    made with (less the endpoint key) and its length in seconds. Archives are
+    read back by rtsloadcompare.py to compare two runs.
+'''
+import json
+import numpy as np
+
+ARCHIVE_VERSION = 1
+
+
+def saveArchive(file_name, columns, arguments, total_seconds):
+    '''
+        columns is [threads, statuses, latencies, timestamps], arguments is 
+        a dictionary of the run arguments.
+    '''
+    threads, statuses, latencies, timestamps = columns
+    information = {}
+    information["version"] = ARCHIVE_VERSION
+    information["arguments"] = arguments
+    information["total_seconds"] = total_seconds
+
+    np.savez_compressed(
+        file_name, 
+        threads = threads, 
+        statuses = statuses, 
+        latencies = latencies, 
+        timestamps = timestamps,
+        information = np.array(json.dumps(information)))
+
+def loadArchive(file_name):
+    '''
+        Returns a dictionary with the columns threads, statuses, latencies and
+        timestamps plus arguments and total_seconds.
+    '''
+    with np.load(file_name) as archive:
+        information = json.loads(archive["information"].item())
+        if information["version"] != ARCHIVE_VERSION:
+            raise Exception("Unsupported archive version {} in {}".format(information["version"], file_name))
+
+        run = {}
+        for column in ["threads", "statuses", "latencies", "timestamps"]:
+            run[column] = archive[column]
+        run["arguments"] = information["arguments"]
+        run["total_seconds"] = information["total_seconds"]
+        return run
@@ -0,0 +1,253 @@
+'''
+    Minimal asyncio HTTP/1.1 client used by the asyncio load engine.
+
+    The requests library is blocking, so driving thousands of in flight calls
+    with it means thousands of OS threads. This client speaks just enough
+    HTTP/1.1 to POST a body to a scoring endpoint and read the response, and
+    keeps a bounded pool of keep-alive connections that are shared by every
+    coroutine running on the event loop.
+
+    Each response carries the time spent in each phase of the call:
+
+        schedule  - open loop only, the call's scheduled time until it started
+        pool_wait - waiting for a free connection in the pool
+        dns       - resolving the host name (new connections only)
+        connect   - TCP connect (new connections only)
+        tls       - TLS handshake (new https connections only)
+        ttfb      - writing the request until the status line arrives, which 
+                    is mostly the time the service spends scoring
+        transfer  - reading the rest of the response
+'''
+import asyncio
+import socket
+import ssl
+import time
+from urllib.parse import urlsplit
+
+# Connection phases in the order they happen
+PHASES = ["schedule", "pool_wait", "dns", "connect", "tls", "ttfb", "transfer"]
+
+
+class AsyncResponse:
+    '''
+        Result of a single call made through the AsyncConnectionPool
+    '''
+    def __init__(self, status_code, headers, body, sent, phases):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        # time.perf_counter() when the request was written to the connection
+        self.sent = sent
+        # {phase : seconds} for the phases this call went through
+        self.phases = phases
+
+
+class _Connection:
+    '''
+        A single open connection to the endpoint.
+    '''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class AsyncConnectionPool:
+    '''
+        Bounded pool of keep-alive connections to a single endpoint. 
+
+        At most pool_size requests are on the wire at any time, callers over
+        that limit wait for a connection to be returned to the pool. 
+
+        If keep_alive is False every call asks the server to close the 
+        connection and a new connection is opened for the next call.
+
+        timeouts is [connect seconds, read seconds], a call that takes longer
+        to connect, or to get its whole response once sent, raises 
+        asyncio.TimeoutError. None (either or both) waits forever.
+    '''
+    def __init__(self, url, headers, pool_size, keep_alive = True, timeouts = None):
+        parts = urlsplit(url)
+        self.secure = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.connect_timeout, self.read_timeout = timeouts if timeouts else [None, None]
+        self.ssl_context = ssl.create_default_context() if self.secure else None
+        self.idle = []
+        self.semaphore = asyncio.Semaphore(pool_size)
+
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        host_header = self.host
+        if parts.port:
+            host_header += ":" + str(parts.port)
+
+        '''
+            Everything but the content length is the same on every call so
+            build the request head once.
+        '''
+        head = "POST {} HTTP/1.1\r\nHost: {}\r\nConnection: {}\r\n".format(path, host_header, "keep-alive" if keep_alive else "close")
+        for key in headers.keys():
+            head += "{}: {}\r\n".format(key, headers[key])
+        self.request_head = head.encode("latin-1")
+
+    async def post(self, body, acquired = None):
+        '''
+            POST the body (bytes) to the endpoint and return an AsyncResponse. 
+            acquired, if given, is called once the call has a connection slot,
+            before it connects or sends anything.
+
+            A keep-alive connection can be closed by the server while it sits
+            idle, so a failure on a reused connection is retried once on a
+            fresh connection.
+        '''
+        waiting = time.perf_counter()
+        async with self.semaphore:
+            phases = {"pool_wait" : time.perf_counter() - waiting}
+            if acquired:
+                acquired()
+            connection = self.idle.pop() if self.idle else await asyncio.wait_for(self._open(phases), self.connect_timeout)
+            try:
+                response, keep_alive = await asyncio.wait_for(self._roundTrip(connection, body, phases), self.read_timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection.close()
+                if not connection.reused:
+                    raise
+                connection = await asyncio.wait_for(self._open(phases), self.connect_timeout)
+                try:
+                    response, keep_alive = await asyncio.wait_for(self._roundTrip(connection, body, phases), self.read_timeout)
+                except Exception:
+                    connection.close()
+                    raise
+            except Exception:
+                connection.close()
+                raise
+
+            if keep_alive and self.keep_alive:
+                connection.reused = True
+                self.idle.append(connection)
+            else:
+                connection.close()
+
+            return response
+
+    def close(self):
+        '''
+            Close all idle connections
+        '''
+        while self.idle:
+            self.idle.pop().close()
+
+    async def aclose(self):
+        self.close()
+
+    async def _open(self, phases):
+        '''
+            Resolve, connect and (for https) handshake as separate steps so 
+            each can be timed into phases.
+        '''
+        loop = asyncio.get_event_loop()
+
+        start = time.perf_counter()
+        addresses = await loop.getaddrinfo(self.host, self.port, type = socket.SOCK_STREAM)
+        resolved = time.perf_counter()
+        phases["dns"] = resolved - start
+
+        sock = None
+        error = None
+        for family, sock_type, proto, canonical_name, address in addresses:
+            sock = socket.socket(family, sock_type, proto)
+            sock.setblocking(False)
+            try:
+                await loop.sock_connect(sock, address)
+                error = None
+                break
+            except OSError as ex:
+                sock.close()
+                sock = None
+                error = ex
+            except BaseException:
+                # Timed out (cancelled) while connecting
+                sock.close()
+                raise
+        if sock is None:
+            raise error or ConnectionError("No address for {}".format(self.host))
+        connected = time.perf_counter()
+        phases["connect"] = connected - resolved
+
+        try:
+            reader, writer = await asyncio.open_connection(
+                sock=sock, 
+                ssl=self.ssl_context, 
+                server_hostname=self.host if self.secure else None)
+        except BaseException:
+            sock.close()
+            raise
+        if self.secure:
+            phases["tls"] = time.perf_counter() - connected
+        return _Connection(reader, writer)
+
+    async def _roundTrip(self, connection, body, phases):
+        sent = time.perf_counter()
+        connection.writer.write(self.request_head + "Content-Length: {}\r\n\r\n".format(len(body)).encode("latin-1") + body)
+        await connection.writer.drain()
+
+        reader = connection.reader
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by server")
+        first_byte = time.perf_counter()
+
+        version, status_code = status_line.split(None, 2)[:2]
+        status_code = int(status_code)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        keep_alive = version == b"HTTP/1.1"
+        connection_header = headers.get("connection", "").lower()
+        if connection_header == "close":
+            keep_alive = False
+        elif connection_header == "keep-alive":
+            keep_alive = True
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._readChunked(reader)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        phases["ttfb"] = first_byte - sent
+        phases["transfer"] = time.perf_counter() - first_byte
+        return AsyncResponse(status_code, headers, body, sent, phases), keep_alive
+
+    async def _readChunked(self, reader):
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # Trailers, if any, end with an empty line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        return b"".join(chunks)
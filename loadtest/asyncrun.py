@@ -0,0 +1,281 @@
+'''
+    Asyncio load engine. 
+
+    Where ThreadRun in rtsloadtest.py uses one OS thread per simulated user,
+    AsyncRun runs every simulated user as a coroutine on a single event loop
+    sharing a bounded pool of keep-alive connections. This lets a single 
+    process keep thousands of calls in flight.
+
+    OpenLoopRun uses the same connection pool but sends calls on a fixed 
+    schedule rather than one after another. 
+'''
+import asyncio
+import random
+import time
+from loadtest.asyncclient import AsyncConnectionPool
+from loadtest.http2client import Http2ConnectionPool
+from loadtest.errors import RetryPolicy, statusKind, exceptionKind
+
+
+def createPool(url, headers, connections, keep_alive, timeouts, http2):
+    '''
+        HTTP/1.1 AsyncConnectionPool, or an Http2ConnectionPool when http2 is set
+    '''
+    if http2:
+        return Http2ConnectionPool(url, headers, connections, keep_alive, timeouts)
+    return AsyncConnectionPool(url, headers, connections, keep_alive, timeouts)
+
+
+async def postWithRetries(pool, body, retry_policy, acquired = None):
+    '''
+        POST body through pool, retrying as retry_policy (loadtest/errors.py) 
+        allows. Returns [response or None, kind, retries], the response is that
+        of the last attempt. acquired is passed to the pool for the first 
+        attempt only.
+    '''
+    retry_policy.call()
+    attempt = 0
+    while True:
+        response = None
+        try:
+            response = await pool.post(body, acquired if attempt == 0 else None)
+            kind = statusKind(response.status_code)
+        except Exception as ex:
+            kind = exceptionKind(ex)
+            error = ex
+        if kind == "ok" or not retry_policy.allowRetry(kind, attempt):
+            break
+        attempt += 1
+
+    if response is None:
+        print(kind, error)
+    return [response, kind, attempt]
+
+
+class AsyncRun:
+    '''
+        Runs users coroutines, each making iterations calls to the endpoint. 
+
+        payloads holds a payload source (loadtest/corpus.py) for each user.
+
+        Every call is reported through 
+            recorder(user_id, status, elapsed, phases, kind, retries)
+        so results end up in the same statistics as the thread engine. phases
+        is the connection phase breakdown of the call (loadtest/asyncclient.py),
+        kind its outcome (loadtest/errors.py) and status is 0 when there was
+        no response.
+
+        If keep_alive is False a new connection is made for every call. User 
+        ids are numbered from first_id. timeouts ([connect, read] seconds) and
+        retry_policy (loadtest/errors.py) apply to every call, a call's latency
+        includes its retries. With http2 set calls are multiplexed over at most
+        connections HTTP/2 connections (loadtest/http2client.py).
+
+        If duration is set users keep calling until duration seconds have 
+        passed instead of stopping after iterations calls. A profile 
+        (loadtest/profiles.py) then sets how many of the users are active at 
+        any time, the rest wait until the profile needs them.
+    '''
+    def __init__(self, users, iterations, url, headers, payloads, connections, recorder, keep_alive = True, first_id = 1, duration = None, profile = None, timeouts = None, retry_policy = None, http2 = False):
+        self.users = users
+        self.iterations = iterations
+        self.url = url
+        self.headers = headers
+        self.payloads = payloads
+        self.connections = connections
+        self.recorder = recorder
+        self.keep_alive = keep_alive
+        self.first_id = first_id
+        self.duration = duration
+        self.profile = profile
+        self.timeouts = timeouts
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.http2 = http2
+        self.start = None
+
+    def run(self):
+        '''
+            Run the test to completion on a new event loop. 
+        '''
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._runAll())
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+
+    async def _runAll(self):
+        pool = createPool(self.url, self.headers, self.connections, self.keep_alive, self.timeouts, self.http2)
+        self.start = time.perf_counter()
+        try:
+            users = [self._runUser(pool, i, self.payloads[i]) for i in range(self.users)]
+            await asyncio.gather(*users)
+        finally:
+            await pool.aclose()
+
+    async def _runUser(self, pool, index, payload):
+        id = self.first_id + index
+        calls = 0
+        while True:
+            if self.duration is None:
+                if calls >= self.iterations:
+                    break
+            else:
+                elapsed = time.perf_counter() - self.start
+                if elapsed >= self.duration:
+                    break
+                if self.profile and index >= self.profile.valueAt(elapsed):
+                    await asyncio.sleep(0.05)
+                    continue
+
+            calls += 1
+            body = payload.next()
+            start = time.perf_counter()
+            response, kind, retries = await postWithRetries(pool, body, self.retry_policy)
+            if response is None:
+                self.recorder(id, 0, time.perf_counter() - start, None, kind, retries)
+            else:
+                self.recorder(id, response.status_code, time.perf_counter() - start, response.phases, kind, retries)
+
+
+class OpenLoopRun:
+    '''
+        Open loop (constant arrival rate) load test. 
+
+        Calls are scheduled at rate requests per second for duration seconds
+        whether or not earlier calls have completed, so a slow service does not
+        slow down the load generator (coordinated omission). Arrivals are either
+        evenly spaced (fixed) or exponentially spaced (poisson). 
+
+        Calls take their bodies from the payload sources in payloads in turn. 
+        If a profile (loadtest/profiles.py) is given it sets the rate at each 
+        point in the test instead. timeouts, retry_policy and http2 are as for
+        AsyncRun.
+
+        Latency is measured from the time the call was scheduled to go out, not
+        from when it actually made it onto a connection. Counters:
+            scheduled - Calls the schedule asked for
+            late      - Calls whose first attempt got a connection more than 
+                        late_threshold seconds after their scheduled time, 
+                        whatever their outcome
+            dropped   - Calls never sent because max_outstanding calls were 
+                        already in flight
+    '''
+    def __init__(self, rate, duration, arrival, url, headers, payloads, connections, max_outstanding, late_threshold, recorder, id = 1, keep_alive = True, profile = None, timeouts = None, retry_policy = None, http2 = False):
+        self.rate = rate
+        self.duration = duration
+        self.arrival = arrival
+        self.url = url
+        self.headers = headers
+        self.payloads = payloads
+        self.connections = connections
+        self.max_outstanding = max_outstanding
+        self.late_threshold = late_threshold
+        self.recorder = recorder
+        self.id = id
+        self.keep_alive = keep_alive
+        self.profile = profile
+        self.timeouts = timeouts
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.http2 = http2
+        self.scheduled = 0
+        self.late = 0
+        self.dropped = 0
+
+    def run(self):
+        '''
+            Run the test to completion on a new event loop. 
+        '''
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._runAll(loop))
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+
+    def getScheduleStatistics(self):
+        '''
+            Dictionary of the schedule counters for reporting
+        '''
+        stats = {}
+        stats["target_rps"] = self.rate
+        if self.profile:
+            stats["profile"] = self.profile.describe()
+        stats["arrival"] = self.arrival
+        stats["scheduled"] = self.scheduled
+        stats["late"] = self.late
+        stats["dropped"] = self.dropped
+        return stats
+
+    def _nextGap(self, elapsed):
+        '''
+            Seconds to the next call. A profile can ask for no load at all, 
+            the rate never drops below one call a second so the profile is 
+            checked again soon.
+        '''
+        rate = self.rate
+        if self.profile:
+            rate = max(self.profile.valueAt(elapsed), 1.0)
+        if self.arrival == "poisson":
+            return random.expovariate(rate)
+        return 1.0 / rate
+
+    async def _runAll(self, loop):
+        pool = createPool(self.url, self.headers, self.connections, self.keep_alive, self.timeouts, self.http2)
+        outstanding = set()
+        try:
+            start = time.perf_counter()
+            end = start + self.duration
+            next_time = start
+
+            while next_time < end:
+                '''
+                    Issue every call whose time has come, then sleep until the next
+                    one. If the loop falls behind the overdue calls go out together
+                    but keep their scheduled time.
+                '''
+                now = time.perf_counter()
+                while next_time <= now and next_time < end:
+                    self.scheduled += 1
+                    if len(outstanding) >= self.max_outstanding:
+                        self.dropped += 1
+                    else:
+                        body = self.payloads[self.scheduled % len(self.payloads)].next()
+                        task = loop.create_task(self._call(pool, body, next_time))
+                        outstanding.add(task)
+                        task.add_done_callback(outstanding.discard)
+                    next_time += self._nextGap(next_time - start)
+
+                if next_time < end:
+                    await asyncio.sleep(next_time - time.perf_counter())
+
+            if outstanding:
+                await asyncio.gather(*outstanding)
+        finally:
+            await pool.aclose()
+
+    async def _call(self, pool, body, scheduled_time):
+        started = time.perf_counter()
+        sent = []
+
+        def acquired():
+            '''
+                Lateness is judged when the first attempt gets a connection, so
+                time queued for the pool counts
+            '''
+            if not sent:
+                sent.append(time.perf_counter())
+                if sent[0] - scheduled_time > self.late_threshold:
+                    self.late += 1
+
+        response, kind, retries = await postWithRetries(pool, body, self.retry_policy, acquired)
+        # A call that failed before the pool called back is judged now
+        acquired()
+        if response is None:
+            self.recorder(self.id, 0, time.perf_counter() - scheduled_time, None, kind, retries)
+            return
+
+        response.phases["schedule"] = started - scheduled_time
+        self.recorder(self.id, response.status_code, time.perf_counter() - scheduled_time, response.phases, kind, retries)
@@ -0,0 +1,136 @@
+'''
+    Comparison of two archived load test runs, a baseline and a candidate. 
+
+    For the mean and each reported percentile the candidate's change from the
+    baseline is given with a bootstrap confidence interval: both runs are 
+    resampled (with replacement) and the statistic recomputed, the interval
+    covers the middle confidence share of the resampled differences. A change
+    is significant when the interval does not include zero. 
+
+    A Mann-Whitney U test (normal approximation with tie correction) is also 
+    reported as an overall test of whether candidate latencies tend to be 
+    higher or lower than the baseline.
+
+    The candidate fails if a statistic got significantly slower by more than
+    its allowed percentage, or its error rate rose by more than the allowed 
+    amount.
+'''
+import math
+import numpy as np
+from loadtest.errors import SUCCESS
+from loadtest.results import PERCENTILES
+
+# Largest number of calls used from each run for each bootstrap resample
+BOOTSTRAP_SAMPLE = 100000
+
+
+def nearestRank(sorted_values, percent):
+    '''
+        Percentile of already sorted values, nearest rank like the load test stats
+    '''
+    rank = max(int(math.ceil(len(sorted_values) * percent / 100.0)), 1)
+    return sorted_values[rank - 1]
+
+def summarize(latencies):
+    '''
+        {"mean" : ..., "p50" : ..., ...} for a latency array
+    '''
+    sorted_values = np.sort(latencies)
+    summary = {"mean" : float(np.mean(sorted_values))}
+    for name, percent in PERCENTILES:
+        summary[name] = float(nearestRank(sorted_values, percent))
+    return summary
+
+def mannWhitney(baseline, candidate):
+    '''
+        Returns [U statistic of the candidate, two sided p value]
+    '''
+    n1 = len(baseline)
+    n2 = len(candidate)
+    combined = np.concatenate([baseline, candidate])
+
+    '''
+        Average ranks, tied values share the mean of the ranks they cover.
+    '''
+    values, inverse, counts = np.unique(combined, return_inverse = True, return_counts = True)
+    upper = np.cumsum(counts)
+    average_ranks = upper - (counts - 1) / 2.0
+    ranks = average_ranks[inverse]
+
+    u_candidate = ranks[n1:].sum() - n2 * (n2 + 1) / 2.0
+    mean_u = n1 * n2 / 2.0
+    tie_term = (counts.astype(np.float64) ** 3 - counts).sum() / ((n1 + n2) * (n1 + n2 - 1.0))
+    variance = n1 * n2 / 12.0 * ((n1 + n2 + 1) - tie_term)
+    if variance <= 0:
+        return [float(u_candidate), 1.0]
+
+    z = (u_candidate - mean_u) / math.sqrt(variance)
+    p_value = math.erfc(abs(z) / math.sqrt(2))
+    return [float(u_candidate), p_value]
+
+def bootstrapDeltas(baseline, candidate, iterations, confidence, seed = 1):
+    '''
+        {statistic : [low, high]} confidence interval of candidate - baseline
+    '''
+    random_state = np.random.RandomState(seed)
+    size_1 = min(len(baseline), BOOTSTRAP_SAMPLE)
+    size_2 = min(len(candidate), BOOTSTRAP_SAMPLE)
+
+    deltas = {}
+    for iteration in range(iterations):
+        sample_1 = summarize(baseline[random_state.randint(0, len(baseline), size_1)])
+        sample_2 = summarize(candidate[random_state.randint(0, len(candidate), size_2)])
+        for name in sample_1.keys():
+            deltas.setdefault(name, []).append(sample_2[name] - sample_1[name])
+
+    tail = (1.0 - confidence) / 2.0 * 100
+    intervals = {}
+    for name in deltas.keys():
+        intervals[name] = [float(np.percentile(deltas[name], tail)), float(np.percentile(deltas[name], 100 - tail))]
+    return intervals
+
+def compareRuns(baseline, candidate, thresholds, max_error_rate_increase, iterations = 200, confidence = 0.95):
+    '''
+        Compare two runs loaded by loadtest.archive.loadArchive. 
+
+        thresholds is {statistic : largest allowed increase in percent}. Only 
+        successful calls are used for latency. Returns a dictionary with a row
+        per statistic, the error rates, the Mann-Whitney result and "passed".
+    '''
+    baseline_ok = baseline["latencies"][(baseline["statuses"] >= SUCCESS[0]) & (baseline["statuses"] < SUCCESS[1])]
+    candidate_ok = candidate["latencies"][(candidate["statuses"] >= SUCCESS[0]) & (candidate["statuses"] < SUCCESS[1])]
+    if len(baseline_ok) == 0 or len(candidate_ok) == 0:
+        raise Exception("Both runs need successful calls to compare")
+
+    baseline_summary = summarize(baseline_ok)
+    candidate_summary = summarize(candidate_ok)
+    intervals = bootstrapDeltas(baseline_ok, candidate_ok, iterations, confidence)
+
+    comparison = {"rows" : [], "passed" : True}
+    for name in baseline_summary.keys():
+        row = {}
+        row["statistic"] = name
+        row["baseline"] = baseline_summary[name]
+        row["candidate"] = candidate_summary[name]
+        row["delta"] = candidate_summary[name] - baseline_summary[name]
+        row["delta_percent"] = row["delta"] / baseline_summary[name] * 100 if baseline_summary[name] else 0
+        row["interval"] = intervals[name]
+        row["significant"] = intervals[name][0] > 0 or intervals[name][1] < 0
+        row["threshold_percent"] = thresholds.get(name)
+        row["regressed"] = row["threshold_percent"] is not None and row["significant"] and row["delta_percent"] > row["threshold_percent"]
+        if row["regressed"]:
+            comparison["passed"] = False
+        comparison["rows"].append(row)
+
+    baseline_error_rate = 1.0 - len(baseline_ok) / len(baseline["latencies"])
+    candidate_error_rate = 1.0 - len(candidate_ok) / len(candidate["latencies"])
+    comparison["baseline_error_rate"] = baseline_error_rate
+    comparison["candidate_error_rate"] = candidate_error_rate
+    comparison["error_rate_regressed"] = candidate_error_rate - baseline_error_rate > max_error_rate_increase
+    if comparison["error_rate_regressed"]:
+        comparison["passed"] = False
+
+    comparison["baseline_rps"] = len(baseline["latencies"]) / baseline["total_seconds"]
+    comparison["candidate_rps"] = len(candidate["latencies"]) / candidate["total_seconds"]
+    comparison["mann_whitney_u"], comparison["mann_whitney_p"] = mannWhitney(baseline_ok, candidate_ok)
+    return comparison
@@ -0,0 +1,146 @@
+'''
+    Payload sources for the load test. 
+
+    Every worker asks its payload source for the next request body with next(),
+    which always returns bytes that are ready to send. 
+
+        FixedPayload  - The same body on every call.
+        PayloadCorpus - Bodies replayed from a JSON lines file, one request body
+                        per line. 
+        BatchPayload  - batch_size bodies from another source sent as one JSON
+                        array, for services that score a list of records, or 
+                        as newline delimited JSON.
+
+    PayloadCorpus memory maps the file and keeps only the offset and length of
+    each line, so the corpus can be much larger than memory. Bodies are sliced 
+    straight out of the file, they are never parsed or re-encoded on the send
+    path. Lines are replayed in one of three modes:
+
+        sequential - In file order, wrapping at the end.
+        random     - Uniformly at random.
+        weighted   - At random in proportion to the number found under 
+                     weight_key in each line (lines without it count as 1). 
+                     This is the only mode that parses the lines, once, while
+                     the index is built.
+'''
+import bisect
+import itertools
+import json
+import mmap
+import os
+import random
+from array import array
+
+
+class FixedPayload:
+    '''
+        Payload source that always returns the same body
+    '''
+    def __init__(self, body):
+        self.body = body
+
+    def next(self):
+        return self.body
+
+
+class BatchPayload:
+    '''
+        Payload source joining batch_size bodies from source into a JSON array,
+        or with ndjson into newline delimited JSON, one body per line. The 
+        bodies are already encoded JSON so they are joined as bytes.
+    '''
+    def __init__(self, source, batch_size, ndjson = False):
+        self.source = source
+        self.batch_size = batch_size
+        self.ndjson = ndjson
+
+    def next(self):
+        if self.ndjson:
+            return b"".join([self.source.next() + b"\n" for i in range(self.batch_size)])
+        return b"[" + b",".join([self.source.next() for i in range(self.batch_size)]) + b"]"
+
+
+class PayloadCorpus:
+    '''
+        Payload source replaying the lines of a JSON lines file
+    '''
+    modes = ["sequential", "random", "weighted"]
+
+    def __init__(self, file_name, mode = "sequential", weight_key = "weight"):
+        if mode not in PayloadCorpus.modes:
+            raise Exception("Unknown corpus mode " + mode)
+
+        self.file_name = file_name
+        self.mode = mode
+        self.weight_key = weight_key
+        self.offsets = array("Q")
+        self.lengths = array("L")
+        self.cumulative_weights = array("d")
+        self.sequence = itertools.count()
+
+        if os.path.getsize(file_name) == 0:
+            raise Exception("Corpus file contains no payloads : " + file_name)
+
+        self.file = open(file_name, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        self._buildIndex()
+
+        if len(self.offsets) == 0:
+            raise Exception("Corpus file contains no payloads : " + file_name)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def body(self, index):
+        '''
+            Body bytes of line index
+        '''
+        start = self.offsets[index]
+        return self.map[start:start + self.lengths[index]]
+
+    def next(self):
+        if self.mode == "random":
+            index = random.randrange(len(self.offsets))
+        elif self.mode == "weighted":
+            index = bisect.bisect_right(self.cumulative_weights, random.random() * self.cumulative_weights[-1])
+            index = min(index, len(self.offsets) - 1)
+        else:
+            # next() on itertools.count is atomic, so threads share the sequence safely
+            index = next(self.sequence) % len(self.offsets)
+        return self.body(index)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def _buildIndex(self):
+        '''
+            Record where each non blank line starts and how long it is, 
+            without the line ending.
+        '''
+        total_weight = 0.0
+        position = 0
+        size = len(self.map)
+        while position < size:
+            end = self.map.find(b"\n", position)
+            if end == -1:
+                end = size
+            line_end = end
+            if line_end > position and self.map[line_end - 1:line_end] == b"\r":
+                line_end -= 1
+
+            if self.map[position:line_end].strip():
+                self.offsets.append(position)
+                self.lengths.append(line_end - position)
+                if self.mode == "weighted":
+                    total_weight += self._lineWeight(self.map[position:line_end])
+                    self.cumulative_weights.append(total_weight)
+
+            position = end + 1
+
+    def _lineWeight(self, line):
+        record = json.loads(line.decode("utf-8"))
+        weight = 1.0
+        if isinstance(record, dict) and self.weight_key in record:
+            weight = float(record[self.weight_key])
+        return max(weight, 0.0)
@@ -0,0 +1,161 @@
+'''
+    Coordinator/agent messaging for distributed load tests. 
+
+    A coordinator listens on a TCP socket and waits for a number of agents
+    (rtsloadtest.py -role agent) to connect. Each agent is handed a test plan,
+    runs it, and streams summaries back while it runs. The final summary from
+    every agent is merged by the coordinator into one report.
+
+    Messages are single lines of JSON:
+
+        coordinator -> agent
+            {"type" : "plan", "agent" : n, "plan" : {...}}
+        agent -> coordinator
+            {"type" : "summary", "agent" : n, "final" : false, "recorder" : {...}}
+            {"type" : "summary", "agent" : n, "final" : true, "recorders" : {...}, "schedule" : {...}}
+
+    Interim summaries hold the agent's results so far merged into one 
+    LatencyRecorder, the final summary holds every per thread recorder. 
+'''
+import json
+import socket
+import time
+from threading import Thread, RLock
+
+
+def sendMessage(stream, message):
+    stream.write((json.dumps(message) + "\n").encode("utf-8"))
+    stream.flush()
+
+def readMessage(stream):
+    '''
+        Read the next message, None when the other side has gone away
+    '''
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+class Coordinator:
+    '''
+        Coordinator end of a distributed load test
+    '''
+    def __init__(self, host, port, agent_count):
+        self.host = host
+        self.port = port
+        self.agent_count = agent_count
+        self.agents = []
+        self.listener = None
+
+    def waitForAgents(self):
+        '''
+            Block until agent_count agents have connected
+        '''
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.host, self.port))
+        self.listener.listen(self.agent_count)
+
+        while len(self.agents) < self.agent_count:
+            connection, address = self.listener.accept()
+            self.agents.append([connection, connection.makefile("rwb")])
+            print("Agent", len(self.agents), "connected from", address)
+
+    def sendPlans(self, plans):
+        '''
+            Send plans[n] to agent n+1
+        '''
+        for index in range(len(self.agents)):
+            sendMessage(self.agents[index][1], {"type" : "plan", "agent" : index + 1, "plan" : plans[index]})
+
+    def collect(self, on_summary):
+        '''
+            Read summaries from every agent until each has sent its final
+            summary (or disconnected). on_summary(message) is called for 
+            every summary, one at a time. 
+
+            Returns the final summary message of each agent.
+        '''
+        finals = {}
+        lock = RLock()
+
+        def readAgent(agent_id, stream):
+            while True:
+                message = readMessage(stream)
+                if message is None:
+                    print("Agent", agent_id, "disconnected")
+                    break
+                lock.acquire()
+                try:
+                    on_summary(message)
+                    if message["final"]:
+                        finals[agent_id] = message
+                finally:
+                    lock.release()
+                if message["final"]:
+                    break
+
+        readers = []
+        for index in range(len(self.agents)):
+            reader = Thread(target = readAgent, args = (index + 1, self.agents[index][1]))
+            reader.start()
+            readers.append(reader)
+        for reader in readers:
+            reader.join()
+
+        return [finals[agent_id] for agent_id in sorted(finals.keys())]
+
+    def close(self):
+        for connection, stream in self.agents:
+            stream.close()
+            connection.close()
+        if self.listener:
+            self.listener.close()
+
+
+class Agent:
+    '''
+        Agent end of a distributed load test
+    '''
+    def __init__(self, host, port, connect_timeout = 60):
+        '''
+            Connect to the coordinator, retrying until connect_timeout seconds
+            have passed so agents can be started before the coordinator.
+        '''
+        self.agent_id = None
+        deadline = time.time() + connect_timeout
+        while True:
+            try:
+                self.connection = socket.create_connection((host, port))
+                break
+            except ConnectionRefusedError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(1)
+        self.stream = self.connection.makefile("rwb")
+
+    def receivePlan(self):
+        message = readMessage(self.stream)
+        if message is None or message["type"] != "plan":
+            raise Exception("Coordinator did not send a test plan")
+        self.agent_id = message["agent"]
+        return message["plan"]
+
+    def sendSummary(self, recorder):
+        '''
+            Send an interim summary, recorder is the LatencyRecorder of all results so far
+        '''
+        sendMessage(self.stream, {"type" : "summary", "agent" : self.agent_id, "final" : False, "recorder" : recorder.toDict()})
+
+    def sendFinal(self, recorders, schedule_stats):
+        '''
+            Send the final summary, recorders is the dictionary of per thread LatencyRecorders
+        '''
+        message = {"type" : "summary", "agent" : self.agent_id, "final" : True, "schedule" : schedule_stats}
+        message["recorders"] = {str(key) : recorders[key].toDict() for key in recorders.keys()}
+        sendMessage(self.stream, message)
+
+    def close(self):
+        self.stream.close()
+        self.connection.close()
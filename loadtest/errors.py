@@ -0,0 +1,98 @@
+'''
+    Error taxonomy and retries for the load engines.
+
+    Every call ends up as one kind:
+
+        ok         - 2xx or 3xx response
+        throttled  - 429 or 503, the service asked the caller to back off
+        4xx        - Any other 4xx response
+        5xx        - Any other 5xx response
+        timeout    - No connection or response within the connect or read timeout
+        connection - The connection was refused, reset or closed mid call
+        other      - Any other failure in the client
+
+    Calls that fail without a response are recorded with status 0.
+
+    A failed call of a retryable kind (throttled, timeout, connection) can be
+    retried up to retries times. Retries are also limited by a budget, a
+    fraction of all calls made plus a small allowance, so a failing service
+    is not hit with a retry storm on top of the test load.
+'''
+import asyncio
+import socket
+
+KINDS = ["ok", "throttled", "4xx", "5xx", "timeout", "connection", "other"]
+RETRYABLE = ["throttled", "timeout", "connection"]
+
+# Statuses from SUCCESS[0] up to, not including, SUCCESS[1] are ok. Every 
+# count of successful calls uses this range.
+SUCCESS = [200, 400]
+
+
+def statusKind(status):
+    '''
+        Kind of a call that got a response with status
+    '''
+    if status == 429 or status == 503:
+        return "throttled"
+    if SUCCESS[0] <= status < SUCCESS[1]:
+        return "ok"
+    if 400 <= status < 500:
+        return "4xx"
+    if status >= 500:
+        return "5xx"
+    return "other"
+
+def exceptionKind(ex):
+    '''
+        Kind of a call that failed with the exception ex. Exceptions from the
+        requests and httpx libraries are matched on their class names so this
+        module does not depend on either.
+    '''
+    names = [cls.__name__ for cls in type(ex).__mro__]
+    if isinstance(ex, (asyncio.TimeoutError, socket.timeout)) or [x for x in names if "Timeout" in x]:
+        return "timeout"
+    if "RequestException" in names:
+        '''
+            Every requests exception is an IOError, but only its connection 
+            errors are about the connection. A bad URL, schema or header is not
+            and retrying it will not help.
+        '''
+        return "connection" if "ConnectionError" in names or "ChunkedEncodingError" in names else "other"
+    if isinstance(ex, (OSError, asyncio.IncompleteReadError)) or [x for x in names if "Connect" in x or "Network" in x]:
+        return "connection"
+    return "other"
+
+
+class RetryPolicy:
+    '''
+        Allows up to retries retries of a call, while the retries across all
+        calls stay under budget x calls + minimum.
+
+        Counters are updated without a lock, so with many threads the budget
+        is approximate.
+    '''
+    def __init__(self, retries = 0, budget = 0.1, minimum = 10):
+        self.retries = retries
+        self.budget = budget
+        self.minimum = minimum
+        self.calls = 0
+        self.retried = 0
+
+    def call(self):
+        '''
+            Count a new call (not a retry)
+        '''
+        self.calls += 1
+
+    def allowRetry(self, kind, attempt):
+        '''
+            True if a call that failed with kind on attempt (0 for the first)
+            should be retried, the retry is taken from the budget.
+        '''
+        if kind not in RETRYABLE or attempt >= self.retries:
+            return False
+        if self.retried >= self.minimum + self.budget * self.calls:
+            return False
+        self.retried += 1
+        return True
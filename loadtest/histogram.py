@@ -0,0 +1,278 @@
+'''
+    Bounded memory latency recording for the load test. 
+
+    Keeping every call in a list grows without bound on long runs, so each 
+    worker records into a LatencyRecorder instead. The recorder holds a 
+    LatencyHistogram, which works like an HDR histogram:
+
+        - Latencies are recorded as whole microseconds.
+        - Values below 2^sub_bucket_bits are counted exactly.
+        - Larger values are counted in log2 sized buckets, each split into
+          2^(sub_bucket_bits-1) linear sub buckets, so every value is 
+          known to within 1 part in 2^(sub_bucket_bits-1) 
+          (sub_bucket_bits = 11 gives 3 significant digits).
+
+    Only buckets that have been hit are stored, and the number of buckets is 
+    capped by the highest trackable value, so memory does not depend on how
+    many calls are made. Histograms with the same settings merge by adding
+    counts, which is how per worker results become the global results.
+'''
+import math
+import time
+from loadtest.errors import SUCCESS, statusKind
+
+class LatencyHistogram:
+    '''
+        Log bucketed histogram of latencies in seconds.
+    '''
+    def __init__(self, sub_bucket_bits = 11, highest_seconds = 3600):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.sub_bucket_half = self.sub_bucket_count >> 1
+        self.highest = int(highest_seconds * 1000000)
+        self.counts = {}
+        self.total_count = 0
+        self.total_micros = 0
+        self.min_micros = None
+        self.max_micros = None
+
+    def record(self, seconds, count = 1):
+        '''
+            Record a latency (in seconds) count times
+        '''
+        micros = min(max(int(round(seconds * 1000000)), 0), self.highest)
+
+        index = self._indexOf(micros)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += count
+        self.total_micros += micros * count
+
+        if self.min_micros is None or micros < self.min_micros:
+            self.min_micros = micros
+        if self.max_micros is None or micros > self.max_micros:
+            self.max_micros = micros
+
+    def merge(self, other):
+        '''
+            Add the counts from another histogram into this one.
+        '''
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise Exception("Cannot merge histograms with different precision")
+
+        for index in other.counts.keys():
+            self.counts[index] = self.counts.get(index, 0) + other.counts[index]
+        self.total_count += other.total_count
+        self.total_micros += other.total_micros
+
+        if other.min_micros is not None and (self.min_micros is None or other.min_micros < self.min_micros):
+            self.min_micros = other.min_micros
+        if other.max_micros is not None and (self.max_micros is None or other.max_micros > self.max_micros):
+            self.max_micros = other.max_micros
+
+    def copy(self):
+        '''
+            Copy of this histogram. Copying the counts dictionary is a single
+            operation under the GIL, so this is safe while another thread is 
+            still recording.
+        '''
+        other = LatencyHistogram(self.sub_bucket_bits)
+        other.highest = self.highest
+        other.counts = self.counts.copy()
+        other.total_count = sum(other.counts.values())
+        other.total_micros = self.total_micros
+        other.min_micros = self.min_micros
+        other.max_micros = self.max_micros
+        return other
+
+    def toDict(self):
+        '''
+            JSON friendly form of the histogram, reversed by fromDict()
+        '''
+        histogram = {}
+        histogram["sub_bucket_bits"] = self.sub_bucket_bits
+        histogram["highest"] = self.highest
+        histogram["counts"] = [[index, self.counts[index]] for index in sorted(self.counts.keys())]
+        histogram["total_micros"] = self.total_micros
+        histogram["min"] = self.min_micros
+        histogram["max"] = self.max_micros
+        return histogram
+
+    @staticmethod
+    def fromDict(histogram):
+        result = LatencyHistogram(histogram["sub_bucket_bits"])
+        result.highest = histogram["highest"]
+        for index, count in histogram["counts"]:
+            result.counts[index] = count
+            result.total_count += count
+        result.total_micros = histogram["total_micros"]
+        result.min_micros = histogram["min"]
+        result.max_micros = histogram["max"]
+        return result
+
+    def percentile(self, percent):
+        '''
+            Latency in seconds at or below which percent of the recorded 
+            values fall. Returns 0 if nothing has been recorded.
+        '''
+        if self.total_count == 0:
+            return 0
+
+        target = max(1, int(math.ceil(self.total_count * percent / 100.0)))
+        running = 0
+        for index in sorted(self.counts.keys()):
+            running += self.counts[index]
+            if running >= target:
+                value = min(max(self._highestEquivalent(index), self.min_micros), self.max_micros)
+                return value / 1000000.0
+
+        return self.max_micros / 1000000.0
+
+    def mean(self):
+        if self.total_count == 0:
+            return 0
+        return self.total_micros / self.total_count / 1000000.0
+
+    def min(self):
+        return (self.min_micros or 0) / 1000000.0
+
+    def max(self):
+        return (self.max_micros or 0) / 1000000.0
+
+    def _indexOf(self, micros):
+        if micros < self.sub_bucket_count:
+            return micros
+        shift = micros.bit_length() - self.sub_bucket_bits
+        sub_bucket = micros >> shift
+        return self.sub_bucket_count + (shift - 1) * self.sub_bucket_half + (sub_bucket - self.sub_bucket_half)
+
+    def _highestEquivalent(self, index):
+        if index < self.sub_bucket_count:
+            return index
+        offset = index - self.sub_bucket_count
+        shift = offset // self.sub_bucket_half + 1
+        sub_bucket = offset % self.sub_bucket_half + self.sub_bucket_half
+        return ((sub_bucket + 1) << shift) - 1
+
+
+class LatencyRecorder:
+    '''
+        Results for a single worker, a latency histogram plus call counters.
+
+        A windowed recorder also records each call into a LatencyRecorder for 
+        the wall clock second it completed in, these windows are taken away
+        with popWindows() to build a live time series (loadtest/timeseries.py).
+
+        When a call reports how long each of its connection phases took (dns,
+        connect, tls, ttfb, transfer) each phase goes into its own histogram
+        in phases. Each kind of outcome (loadtest/errors.py) also gets its own
+        histogram in kinds, and retries counts the retries calls needed.
+    '''
+    def __init__(self, windowed = False):
+        self.histogram = LatencyHistogram()
+        self.success = 0
+        self.errors = 0
+        self.retries = 0
+        self.phases = {}
+        self.kinds = {}
+        self.windows = {} if windowed else None
+
+    def record(self, status, elapsed, phases = None, kind = None, retries = 0):
+        '''
+            Record one call, status is the HTTP status code (0 for no response),
+            phases is an optional {phase : seconds}, kind is the outcome of the
+            call when it is not decided by status and retries is how many times
+            the call was retried.
+        '''
+        if SUCCESS[0] <= status < SUCCESS[1]:
+            self.success += 1
+        else:
+            self.errors += 1
+        self.histogram.record(elapsed)
+        self.retries += retries
+
+        if kind is None:
+            kind = statusKind(status)
+        histogram = self.kinds.get(kind)
+        if histogram is None:
+            histogram = self.kinds.setdefault(kind, LatencyHistogram())
+        histogram.record(elapsed)
+
+        if phases:
+            for phase in phases.keys():
+                histogram = self.phases.get(phase)
+                if histogram is None:
+                    histogram = self.phases.setdefault(phase, LatencyHistogram())
+                histogram.record(phases[phase])
+
+        if self.windows is not None:
+            second = int(time.time())
+            window = self.windows.get(second)
+            if window is None:
+                window = self.windows.setdefault(second, LatencyRecorder())
+            window.record(status, elapsed, kind = kind)
+
+    def popWindows(self, before = None):
+        '''
+            Remove and return {second : LatencyRecorder} for windows earlier 
+            than before, or all windows when before is None.
+        '''
+        windows = {}
+        if self.windows:
+            for second in list(self.windows.keys()):
+                if before is None or second < before:
+                    windows[second] = self.windows.pop(second)
+        return windows
+
+    def merge(self, other):
+        self.histogram.merge(other.histogram)
+        self.success += other.success
+        self.errors += other.errors
+        self.retries += other.retries
+        for phase in list(other.phases.keys()):
+            if phase not in self.phases:
+                self.phases[phase] = LatencyHistogram()
+            self.phases[phase].merge(other.phases[phase])
+        for kind in list(other.kinds.keys()):
+            if kind not in self.kinds:
+                self.kinds[kind] = LatencyHistogram()
+            self.kinds[kind].merge(other.kinds[kind])
+
+    def calls(self):
+        return self.success + self.errors
+
+    def copy(self):
+        other = LatencyRecorder()
+        other.histogram = self.histogram.copy()
+        other.success = self.success
+        other.errors = self.errors
+        other.retries = self.retries
+        for phase in list(self.phases.keys()):
+            other.phases[phase] = self.phases[phase].copy()
+        for kind in list(self.kinds.keys()):
+            other.kinds[kind] = self.kinds[kind].copy()
+        return other
+
+    def toDict(self):
+        recorder = {}
+        recorder["histogram"] = self.histogram.toDict()
+        recorder["success"] = self.success
+        recorder["errors"] = self.errors
+        recorder["retries"] = self.retries
+        recorder["phases"] = {phase : self.phases[phase].toDict() for phase in list(self.phases.keys())}
+        recorder["kinds"] = {kind : self.kinds[kind].toDict() for kind in list(self.kinds.keys())}
+        return recorder
+
+    @staticmethod
+    def fromDict(recorder):
+        result = LatencyRecorder()
+        result.histogram = LatencyHistogram.fromDict(recorder["histogram"])
+        result.success = recorder["success"]
+        result.errors = recorder["errors"]
+        result.retries = recorder.get("retries", 0)
+        phases = recorder.get("phases", {})
+        for phase in phases.keys():
+            result.phases[phase] = LatencyHistogram.fromDict(phases[phase])
+        kinds = recorder.get("kinds", {})
+        for kind in kinds.keys():
+            result.kinds[kind] = LatencyHistogram.fromDict(kinds[kind])
+        return result
@@ -0,0 +1,81 @@
+'''
+    HTTP/2 client for the asyncio load engines, an alternative to the HTTP/1.1
+    AsyncConnectionPool in loadtest/asyncclient.py with the same interface.
+
+    HTTP/1.1 carries one call per connection at a time, so keeping c calls in
+    flight needs c connections. HTTP/2 multiplexes many concurrent calls as
+    streams over a few connections. The client is built on httpx, which is
+    optional and only needed for this mode:
+
+        pip install httpx[http2]
+
+    https endpoints negotiate HTTP/2 with the ingress (ALPN) and fall back to
+    HTTP/1.1, with a warning, if it is not offered. http endpoints are spoken
+    to with HTTP/2 directly (h2c prior knowledge), which the endpoint must 
+    support.
+
+    Responses carry the ttfb and transfer phases only, httpx does not expose
+    connection setup timings.
+'''
+import time
+from urllib.parse import urlsplit
+from loadtest.asyncclient import AsyncResponse
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class Http2ConnectionPool:
+    '''
+        Calls to a single endpoint multiplexed over at most connections HTTP/2
+        connections. timeouts is [connect seconds, read seconds] as for the
+        AsyncConnectionPool.
+    '''
+    def __init__(self, url, headers, connections, keep_alive = True, timeouts = None):
+        if httpx is None:
+            raise Exception("HTTP/2 mode needs httpx with HTTP/2 support, pip install httpx[http2]")
+
+        connect_timeout, read_timeout = timeouts if timeouts else [None, None]
+        secure = urlsplit(url).scheme == "https"
+
+        self.url = url
+        self.headers = dict(headers)
+        self.warned = False
+        self.client = httpx.AsyncClient(
+            http1 = secure,
+            http2 = True,
+            headers = self.headers,
+            limits = httpx.Limits(max_connections = connections, max_keepalive_connections = connections if keep_alive else 0),
+            timeout = httpx.Timeout(None, connect = connect_timeout, read = read_timeout))
+
+    async def post(self, body, acquired = None):
+        '''
+            POST the body (bytes) to the endpoint and return an AsyncResponse.
+            acquired, if given, is called when httpx starts to connect or to 
+            send the request, so once it is past waiting for the pool.
+        '''
+        extensions = {}
+        if acquired:
+            async def trace(event, info):
+                if event.endswith(".connect_tcp.started") or event.endswith(".send_request_headers.started"):
+                    acquired()
+            extensions["trace"] = trace
+
+        sent = time.perf_counter()
+        async with self.client.stream("POST", self.url, content = body, extensions = extensions) as response:
+            first_byte = time.perf_counter()
+            content = await response.aread()
+
+        phases = {"ttfb" : first_byte - sent, "transfer" : time.perf_counter() - first_byte}
+        if response.http_version != "HTTP/2" and not self.warned:
+            print("Endpoint answered with", response.http_version, "HTTP/2 was not negotiated")
+            self.warned = True
+        return AsyncResponse(response.status_code, dict(response.headers), content, sent, phases)
+
+    async def aclose(self):
+        '''
+            Close all connections
+        '''
+        await self.client.aclose()
@@ -0,0 +1,72 @@
+'''
+    Load profiles, how the target load changes over the length of a test. 
+
+    The target is either a request rate (open loop) or a number of concurrent
+    users (closed loop), the profile only deals in numbers:
+
+        constant - start for the whole test.
+        ramp     - Linear from start to end over the test.
+        step     - A staircase of steps equal steps from start to end.
+        spike    - start, except end for spike_length seconds beginning at 
+                   spike_start seconds into the test.
+'''
+
+class LoadProfile:
+    '''
+        Target load at any point in a test of duration seconds
+    '''
+    kinds = ["constant", "ramp", "step", "spike"]
+
+    def __init__(self, kind, start, end, duration, steps = 5, spike_start = None, spike_length = 10):
+        if kind not in LoadProfile.kinds:
+            raise Exception("Unknown load profile " + kind)
+
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.steps = max(steps, 1)
+        self.spike_start = spike_start if spike_start is not None else duration / 3.0
+        self.spike_length = spike_length
+
+    def valueAt(self, elapsed):
+        '''
+            Target load elapsed seconds into the test
+        '''
+        if self.kind == "ramp":
+            fraction = min(max(elapsed / self.duration, 0.0), 1.0)
+            return self.start + (self.end - self.start) * fraction
+
+        if self.kind == "step":
+            if self.steps == 1:
+                return self.end
+            step = min(int(elapsed / (self.duration / self.steps)), self.steps - 1)
+            return self.start + (self.end - self.start) * step / (self.steps - 1)
+
+        if self.kind == "spike":
+            if self.spike_start <= elapsed < self.spike_start + self.spike_length:
+                return self.end
+            return self.start
+
+        return self.start
+
+    def peak(self):
+        if self.kind == "constant":
+            return self.start
+        return max(self.start, self.end)
+
+    def scaled(self, share):
+        '''
+            The same profile with every value multiplied by share, used to
+            split a profile across processes or agents.
+        '''
+        return LoadProfile(self.kind, self.start * share, self.end * share, self.duration, self.steps, self.spike_start, self.spike_length)
+
+    def describe(self):
+        if self.kind == "constant":
+            return "constant {}".format(self.start)
+        if self.kind == "spike":
+            return "spike {} -> {} at {}s for {}s".format(self.start, self.end, self.spike_start, self.spike_length)
+        if self.kind == "step":
+            return "step {} -> {} in {} steps".format(self.start, self.end, self.steps)
+        return "ramp {} -> {}".format(self.start, self.end)
@@ -0,0 +1,162 @@
+'''
+    Raw call results and the vectorized statistics engine. 
+
+    The latency histograms in loadtest/histogram.py keep memory fixed but only
+    approximate percentiles. When every call is needed (exact percentiles, 
+    per status breakdowns, archiving a run) the results are kept as NumPy 
+    columns instead:
+
+        threads    - int64   thread (user) id
+        statuses   - int32   HTTP status code
+        latencies  - float64 latency in seconds
+        timestamps - float64 time.time() the call completed
+
+    computeStatistics() produces the global, per thread and per status stats
+    from those columns in one grouped pass: the latencies are sorted once, and
+    each grouping is a stable sort of the group keys in latency order, after
+    which every statistic for every group is a vectorized reduction or gather. 
+'''
+from threading import RLock
+import numpy as np
+from loadtest.errors import SUCCESS
+
+# Percentiles reported for every group, as [name, percent]
+PERCENTILES = [["p50", 50], ["p90", 90], ["p99", 99], ["p99.9", 99.9]]
+
+
+class ResultBuffer:
+    '''
+        Preallocated columns for the calls of a single worker. Only the worker
+        writes to it so append() takes no lock. The count is raised after the
+        row is written, so a reader on another thread sees only complete rows.
+    '''
+    def __init__(self, capacity = 4096):
+        self.size = 0
+        self.statuses = np.empty(max(capacity, 1), dtype = np.int32)
+        self.latencies = np.empty(max(capacity, 1), dtype = np.float64)
+        self.timestamps = np.empty(max(capacity, 1), dtype = np.float64)
+
+    def append(self, status, elapsed, timestamp):
+        index = self.size
+        if index == len(self.latencies):
+            self._grow(index * 2)
+        self.statuses[index] = status
+        self.latencies[index] = elapsed
+        self.timestamps[index] = timestamp
+        self.size = index + 1
+
+    def columns(self, thread):
+        '''
+            [threads, statuses, latencies, timestamps] of the calls so far
+        '''
+        size = self.size
+        return [np.full(size, thread, dtype = np.int64), self.statuses[:size], self.latencies[:size], self.timestamps[:size]]
+
+    def _grow(self, capacity):
+        self.statuses = np.resize(self.statuses, capacity)
+        self.latencies = np.resize(self.latencies, capacity)
+        self.timestamps = np.resize(self.timestamps, capacity)
+
+
+class ResultStore:
+    '''
+        Call results of every worker. Each worker (thread id) writes to its 
+        own ResultBuffer, the lock is only taken to add a buffer or merge in
+        columns from another process. columns() merges everything, at the 
+        end of a run or as a snapshot while it is running.
+    '''
+    def __init__(self):
+        self.lock = RLock()
+        self.buffers = {}
+        self.merged = []
+
+    def buffer(self, thread, capacity = 4096):
+        '''
+            The buffer for thread, preallocated for capacity calls when it is new
+        '''
+        buffer = self.buffers.get(thread)
+        if buffer is None:
+            self.lock.acquire()
+            buffer = self.buffers.setdefault(thread, ResultBuffer(capacity))
+            self.lock.release()
+        return buffer
+
+    def append(self, thread, status, elapsed, timestamp):
+        self.buffer(thread).append(status, elapsed, timestamp)
+
+    def extend(self, columns):
+        '''
+            Add the columns returned by another store's columns()
+        '''
+        self.lock.acquire()
+        self.merged.append(columns)
+        self.lock.release()
+
+    def columns(self):
+        '''
+            [threads, statuses, latencies, timestamps] of the recorded calls
+        '''
+        self.lock.acquire()
+        parts = list(self.merged)
+        buffers = list(self.buffers.items())
+        self.lock.release()
+
+        for thread, buffer in buffers:
+            parts.append(buffer.columns(thread))
+        if len(parts) == 0:
+            return [np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int32), np.empty(0, dtype = np.float64), np.empty(0, dtype = np.float64)]
+        return [np.concatenate([part[column] for part in parts]) for column in range(4)]
+
+
+def _groupStatistics(keys, statuses, latencies, order):
+    '''
+        Statistics for every distinct key. order sorts the calls by latency, 
+        the result is {key : stats}.
+    '''
+    grouped = order[np.argsort(keys[order], kind = "stable")]
+    group_keys, starts, counts = np.unique(keys[grouped], return_index = True, return_counts = True)
+    sorted_latencies = latencies[grouped]
+    ok = (statuses[grouped] >= SUCCESS[0]) & (statuses[grouped] < SUCCESS[1])
+    success = np.add.reduceat(ok.astype(np.int64), starts)
+    totals = np.add.reduceat(sorted_latencies, starts)
+    ends = starts + counts - 1
+
+    columns = {}
+    columns["calls"] = counts
+    columns["success"] = success
+    columns["errors"] = counts - success
+    columns["average"] = totals / counts
+    columns["min"] = sorted_latencies[starts]
+    columns["max"] = sorted_latencies[ends]
+    for name, percent in PERCENTILES:
+        ranks = np.maximum(np.ceil(counts * percent / 100.0).astype(np.int64), 1)
+        columns[name] = sorted_latencies[starts + ranks - 1]
+
+    results = {}
+    for index in range(len(group_keys)):
+        stats = {}
+        for name in columns.keys():
+            stats[name] = columns[name][index].item()
+        results[group_keys[index].item()] = stats
+    return results
+
+
+def computeStatistics(threads, statuses, latencies):
+    '''
+        Returns [global stats, {thread : stats}, {status : stats}] with the 
+        same keys the histogram based statistics use, but exact percentiles
+        (nearest rank). With no calls every global statistic is 0.
+    '''
+    if len(latencies) == 0:
+        empty = {"calls" : 0, "success" : 0, "errors" : 0, "average" : 0, "min" : 0, "max" : 0}
+        for name, percent in PERCENTILES:
+            empty[name] = 0
+        return [empty, {}, {}]
+
+    order = np.argsort(latencies, kind = "stable")
+    everything = np.zeros(len(latencies), dtype = np.int64)
+
+    global_stats = _groupStatistics(everything, statuses, latencies, order)[0]
+    thread_stats = _groupStatistics(threads, statuses, latencies, order)
+    status_stats = _groupStatistics(statuses, statuses, latencies, order)
+    return [global_stats, thread_stats, status_stats]
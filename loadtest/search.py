@@ -0,0 +1,110 @@
+'''
+    Saturation search, finds the most load a deployment can sustain. 
+
+    The search runs a series of stages, each at a higher target load (a request
+    rate or a number of concurrent users) than the last. After each stage the 
+    p99 latency and error rate are checked against a latency SLO and an error 
+    budget, and the search stops at the first stage that breaks either one.
+
+    Reported:
+        max_sustainable_rps - Highest successful calls per second of any stage 
+                              that met the SLO and error budget.
+        knee_*              - The stage at the knee of the p99 latency vs target
+                              load curve, found by the Kneedle method: with both
+                              axes normalized to 0..1, the knee is the point 
+                              furthest below the straight line joining the first
+                              and last stages.
+'''
+import time
+from loadtest.histogram import LatencyRecorder
+
+
+def findKnee(targets, latencies):
+    '''
+        Index of the knee of an increasing latency curve, None if there are
+        fewer than three points, the curve does not rise from its first point
+        to its last, or the furthest point is an end point.
+    '''
+    if len(targets) < 3 or latencies[-1] <= latencies[0]:
+        return None
+
+    x_low, x_high = min(targets), max(targets)
+    y_low, y_high = min(latencies), max(latencies)
+    if x_high == x_low or y_high == y_low:
+        return None
+
+    best_index = None
+    best_distance = 0
+    for index in range(1, len(targets) - 1):
+        x = (targets[index] - x_low) / (x_high - x_low)
+        y = (latencies[index] - y_low) / (y_high - y_low)
+        if x - y > best_distance:
+            best_distance = x - y
+            best_index = index
+
+    return best_index
+
+
+class SaturationSearch:
+    '''
+        run_stage(target, recorder) runs one stage at the target load, recording
+        every call into recorder (a LatencyRecorder). Targets start at start and 
+        grow by step each stage, for at most max_stages stages.
+    '''
+    def __init__(self, run_stage, start, step, max_stages, slo_p99, error_budget):
+        self.run_stage = run_stage
+        self.start = start
+        self.step = step
+        self.max_stages = max_stages
+        self.slo_p99 = slo_p99
+        self.error_budget = error_budget
+        self.stages = []
+
+    def run(self):
+        target = self.start
+        for index in range(self.max_stages):
+            recorder = LatencyRecorder()
+            stage_start = time.perf_counter()
+            self.run_stage(target, recorder)
+            seconds = time.perf_counter() - stage_start
+
+            stage = {}
+            stage["target"] = target
+            stage["calls"] = recorder.calls()
+            stage["throughput"] = recorder.success / seconds
+            stage["p50"] = recorder.histogram.percentile(50)
+            stage["p99"] = recorder.histogram.percentile(99)
+            stage["error_rate"] = recorder.errors / recorder.calls() if recorder.calls() else 1.0
+            stage["passed"] = recorder.calls() > 0 and stage["p99"] <= self.slo_p99 and stage["error_rate"] <= self.error_budget
+            self.stages.append(stage)
+
+            print("Stage {} target = {} throughput = {:.1f} p50 = {} p99 = {} error_rate = {:.2%} {}".format(
+                index + 1, target, stage["throughput"], stage["p50"], stage["p99"], stage["error_rate"], "PASS" if stage["passed"] else "FAIL"))
+
+            if not stage["passed"]:
+                break
+            target += self.step
+
+        return self.getSearchStatistics()
+
+    def getSearchStatistics(self):
+        '''
+            Dictionary of the search results for reporting
+        '''
+        stats = {}
+        stats["stages"] = len(self.stages)
+        stats["slo_p99"] = self.slo_p99
+        stats["error_budget"] = self.error_budget
+
+        passed = [x for x in self.stages if x["passed"]]
+        stats["max_sustainable_rps"] = max([x["throughput"] for x in passed]) if passed else 0
+        stats["max_sustainable_target"] = max([x["target"] for x in passed]) if passed else None
+        stats["saturated"] = len(passed) < len(self.stages)
+
+        knee = findKnee([x["target"] for x in self.stages], [x["p99"] for x in self.stages])
+        if knee is not None:
+            stats["knee_target"] = self.stages[knee]["target"]
+            stats["knee_rps"] = self.stages[knee]["throughput"]
+            stats["knee_p99"] = self.stages[knee]["p99"]
+
+        return stats
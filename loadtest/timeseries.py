@@ -0,0 +1,158 @@
+'''
+    Live per second metrics for a running load test. 
+
+    Windowed LatencyRecorders keep one small recorder per wall clock second. 
+    LiveMetrics runs on its own thread, periodically collects the windows that 
+    are complete and, once a second can no longer receive results, emits:
+
+        second      - Seconds since the test started
+        time        - Wall clock time of the window
+        rps         - Calls that completed in the window
+        errors      - Failed calls that completed in the window
+        error_rate  - errors / rps
+        p50/p90/p99 - Latency percentiles (seconds) of calls in the window
+        max         - Slowest call (seconds) in the window
+
+    Each window is printed to the console and/or appended to a time series 
+    file, JSON lines if the file name ends in .jsonl or .json otherwise CSV. 
+    Seconds in which nothing completed are still emitted, with zero calls, so
+    a stalled service shows up as a gap in throughput.
+'''
+import json
+import time
+from datetime import datetime
+from threading import Thread, Event
+from loadtest.histogram import LatencyRecorder
+
+# Seconds a window is held back before it is treated as complete
+COMPLETE_LAG = 2
+
+
+def popWindows(recorders, before = None):
+    '''
+        Take the windows earlier than before (all windows if None) from a 
+        list of windowed recorders, merged into {second : LatencyRecorder}.
+
+        Windows from the last second before 'before' may still be written to,
+        so callers pass a before at least one second in the past.
+    '''
+    merged = {}
+    for recorder in recorders:
+        for second, window in recorder.popWindows(before).items():
+            if second in merged:
+                merged[second].merge(window)
+            else:
+                merged[second] = window
+    return merged
+
+
+class WindowForwarder(Thread):
+    '''
+        Used in worker processes, sends completed windows from the process's
+        recorders to a queue read by the LiveMetrics of the parent process.
+    '''
+    def __init__(self, queue, recorders):
+        Thread.__init__(self)
+        self.daemon = True
+        self.queue = queue
+        self.recorders = recorders
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.wait(0.5):
+            self._forward(int(time.time()) - 1)
+        self._forward(None)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def _forward(self, before):
+        windows = popWindows(list(self.recorders.values()), before)
+        if windows:
+            self.queue.put({second : windows[second].toDict() for second in windows.keys()})
+
+
+class LiveMetrics(Thread):
+    '''
+        Collects completed windows with collect(final) and emits one row per 
+        second. collect returns {second : LatencyRecorder}, when final is True
+        it must return everything that is left. 
+
+        A second is emitted lag seconds after it ends, windows that come from
+        other processes need a longer lag to allow for the time in transit.
+    '''
+    def __init__(self, collect, console = True, output_file = None, lag = COMPLETE_LAG):
+        Thread.__init__(self)
+        self.daemon = True
+        self.collect = collect
+        self.console = console
+        self.output_file = output_file
+        self.lag = lag
+        self.output = None
+        self.pending = {}
+        self.start_second = int(time.time())
+        self.next_second = self.start_second
+        self.stopped = Event()
+
+        if output_file:
+            self.output = open(output_file, "w")
+            if not self._isJson():
+                self.output.write("second,time,rps,errors,error_rate,p50,p90,p99,max\n")
+
+    def run(self):
+        while not self.stopped.wait(0.5):
+            self._emitReady(False)
+        self._emitReady(True)
+        if self.output:
+            self.output.close()
+
+    def stop(self):
+        '''
+            Emit everything still pending and wait for the thread to finish
+        '''
+        self.stopped.set()
+        self.join()
+
+    def _isJson(self):
+        return self.output_file.endswith(".jsonl") or self.output_file.endswith(".json")
+
+    def _emitReady(self, final):
+        for second, window in self.collect(final).items():
+            if second in self.pending:
+                self.pending[second].merge(window)
+            else:
+                self.pending[second] = window
+
+        if final:
+            last = max(self.pending.keys()) if self.pending else self.next_second - 1
+        else:
+            last = int(time.time()) - self.lag
+
+        while self.next_second <= last:
+            self._emit(self.next_second, self.pending.pop(self.next_second, LatencyRecorder()))
+            self.next_second += 1
+
+    def _emit(self, second, window):
+        calls = window.calls()
+        row = {}
+        row["second"] = second - self.start_second
+        row["time"] = datetime.fromtimestamp(second).isoformat()
+        row["rps"] = calls
+        row["errors"] = window.errors
+        row["error_rate"] = window.errors / calls if calls else 0
+        row["p50"] = window.histogram.percentile(50)
+        row["p90"] = window.histogram.percentile(90)
+        row["p99"] = window.histogram.percentile(99)
+        row["max"] = window.histogram.max()
+
+        if self.console:
+            print("Live [{:>4}s] rps = {} errors = {} ({:.1%}) p50 = {} p90 = {} p99 = {} max = {}".format(
+                row["second"], row["rps"], row["errors"], row["error_rate"], row["p50"], row["p90"], row["p99"], row["max"]))
+
+        if self.output:
+            if self._isJson():
+                self.output.write(json.dumps(row) + "\n")
+            else:
+                self.output.write(",".join([str(row[key]) for key in ["second", "time", "rps", "errors", "error_rate", "p50", "p90", "p99", "max"]]) + "\n")
+            self.output.flush()
@@ -1,24 +1,768 @@
+import hashlib
 import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque, OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from azureml.contrib.services.aml_request import rawhttp
+except ImportError:
+    rawhttp = None
+
+try:
+    from azureml.contrib.services.aml_response import AMLResponse
+except ImportError:
+    class AMLResponse:
+        '''
+            Stand in for the container's AMLResponse when the azureml packages 
+            are not installed, i.e. under rtslocalservice.py.
+        '''
+        def __init__(self, message, status_code, response_headers = None, json_str = False):
+            self.message = message
+            self.status_code = status_code
+            self.headers = response_headers if response_headers else {}
+            self.json_str = json_str
+            self.is_streamed = json_str and not isinstance(self.message, (str, bytes))
+
+        def get_data(self):
+            return (self.message if self.json_str else json.dumps(self.message)).encode("utf-8")
+
+        def iter_encoded(self):
+            for chunk in self.message:
+                yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+# Schema every record is validated against, compiled by init(). Supports
+# type, required and properties.
+RECORD_SCHEMA = {
+    "type" : "object",
+    "required" : ["name"],
+    "properties" : {
+        "name" : {"type" : "string"}
+    }
+}
+
+# JSON types and the Python types they are parsed to
+JSON_TYPES = {
+    "object" : (dict,),
+    "array" : (list,),
+    "string" : (str,),
+    "integer" : (int,),
+    "number" : (int, float),
+    "boolean" : (bool,),
+    "null" : (type(None),)
+}
+
+# Micro batcher, set by init() when SCORING_BATCH_MAX_RECORDS is over 1
+batcher = None
+
+# Response cache, set by init() when SCORING_CACHE_ENTRIES is over 0
+cache = None
+
+# Phase timers, set by init() when SCORING_PHASE_TIMERS or SCORING_TIMING_HEADER is 1
+timers = None
+timing_header = False
+
+# The model, set once loaded. ready is set when it is loaded and warmed up,
+# loaded is set after ready or after a load has failed, load_error holds why.
+model = None
+ready = threading.Event()
+loaded = threading.Event()
+load_error = None
+load_lock = threading.Lock()
+load_mode = "eager"
+init_timings = {}
+
+# Content type of newline delimited JSON, the streaming request and response
+NDJSON = "application/x-ndjson"
+
+# Records scored at a time in the streaming mode, set by init()
+stream_chunk_records = 500
+
+
+class JsonCodec:
+    '''
+        JSON encoding used by run(). 
+
+            orjson - The orjson package, several times faster than json. The 
+                     package has to be installed in the image.
+            json   - The standard library json module.
+            auto   - orjson when it is installed, json otherwise.
+
+        loads and dumps work on str like their json counterparts, canonical 
+        returns compact bytes with sorted keys for the response cache key.
+    '''
+    names = ["auto", "orjson", "json"]
+
+    def __init__(self, name = "auto"):
+        if name not in JsonCodec.names:
+            raise Exception("Unknown JSON codec " + name)
+        if name == "auto":
+            name = "orjson" if orjson else "json"
+        if name == "orjson" and orjson is None:
+            raise Exception("The orjson codec needs the orjson package")
+
+        self.name = name
+        if name == "orjson":
+            self.loads = orjson.loads
+            self.dumps = lambda value: orjson.dumps(value).decode("utf-8")
+            self.canonical = lambda value: orjson.dumps(value, option = orjson.OPT_SORT_KEYS)
+        else:
+            self.loads = json.loads
+            self.dumps = json.dumps
+            self.canonical = lambda value: json.dumps(value, sort_keys = True, separators = (",", ":")).encode("utf-8")
+
+# JSON codec, set by init() from SCORING_JSON_CODEC
+codec = JsonCodec("json")
+
+# Record validator, compiled by init() from RECORD_SCHEMA
+validateRecord = None
+
+
+class MicroBatcher:
+    '''
+        Collects the records of concurrent run() calls and scores them together.
+
+        Callers queue their records and wait. A dispatcher thread takes queued
+        records until it has max_records of them or the oldest has waited 
+        max_wait seconds, scores them with one call to score, and hands each
+        caller its own results. Callers that are already sending a list are 
+        kept together in one batch.
+
+        metrics() reports the queue depth and batch sizes so the window can be
+        tuned, and a summary is printed to the log every log_seconds.
+    '''
+    def __init__(self, score, max_records, max_wait, log_seconds = 60):
+        self.score = score
+        self.max_records = max_records
+        self.max_wait = max_wait
+        self.log_seconds = log_seconds
+        self.queue = deque()
+        self.queued_records = 0
+        self.condition = threading.Condition()
+
+        self.batches = 0
+        self.calls = 0
+        self.records = 0
+        self.max_queue_depth = 0
+        self.max_batch_size = 0
+        self.batch_sizes = {}
+        self.total_wait = 0.0
+        self.last_log = time.time()
+
+        dispatcher = threading.Thread(target = self._dispatch)
+        dispatcher.daemon = True
+        dispatcher.start()
+
+    def submit(self, records):
+        '''
+            Queue a list of records and wait for their results, in the same order
+        '''
+        item = [records, None, threading.Event(), time.perf_counter()]
+        with self.condition:
+            self.queue.append(item)
+            self.queued_records += len(records)
+            self.max_queue_depth = max(self.max_queue_depth, self.queued_records)
+            self.condition.notify()
+
+        item[2].wait()
+        if isinstance(item[1], Exception):
+            raise item[1]
+        return item[1]
+
+    def metrics(self):
+        metrics = {}
+        metrics["batches"] = self.batches
+        metrics["calls"] = self.calls
+        metrics["records"] = self.records
+        metrics["queue_depth"] = self.queued_records
+        metrics["max_queue_depth"] = self.max_queue_depth
+        metrics["average_batch_size"] = self.records / self.batches if self.batches else 0
+        metrics["max_batch_size"] = self.max_batch_size
+        metrics["batch_sizes"] = dict(self.batch_sizes)
+        metrics["average_wait_ms"] = self.total_wait / self.calls * 1000 if self.calls else 0
+        return metrics
+
+    def _dispatch(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+
+                deadline = self.queue[0][3] + self.max_wait
+                while self.queued_records < self.max_records:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                batch = []
+                count = 0
+                while self.queue and (count == 0 or count + len(self.queue[0][0]) <= self.max_records):
+                    item = self.queue.popleft()
+                    batch.append(item)
+                    count += len(item[0])
+                self.queued_records -= count
+
+            started = time.perf_counter()
+            records = [record for item in batch for record in item[0]]
+            try:
+                results = self.score(records)
+            except Exception as e:
+                results = e
+
+            offset = 0
+            for item in batch:
+                self.total_wait += started - item[3]
+                if isinstance(results, Exception):
+                    item[1] = results
+                else:
+                    item[1] = results[offset:offset + len(item[0])]
+                offset += len(item[0])
+                item[2].set()
+
+            self.batches += 1
+            self.calls += len(batch)
+            self.records += count
+            self.max_batch_size = max(self.max_batch_size, count)
+            self.batch_sizes[count] = self.batch_sizes.get(count, 0) + 1
+
+            if time.time() - self.last_log >= self.log_seconds:
+                self.last_log = time.time()
+                print("Micro batcher:", json.dumps(self.metrics()))
+
+
+class ResponseCache:
+    '''
+        In process cache of run() responses keyed on a hash of the parsed 
+        payload, so the same input in a different key order or spacing is a hit.
+
+        Bounded by max_entries responses and max_bytes of response text, 
+        measured as UTF-8, the least recently used responses are evicted first. Responses older than
+        ttl seconds are treated as missing and dropped.
+    '''
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def key(self, data):
+        '''
+            Hash of the canonical JSON of the parsed payload
+        '''
+        return hashlib.sha256(codec.canonical(data)).digest()
+
+    def get(self, key):
+        '''
+            The cached response for key, or None
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, response):
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = [response, time.time() + self.ttl, size]
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def metrics(self):
+        metrics = {}
+        metrics["entries"] = len(self.entries)
+        metrics["bytes"] = self.bytes
+        metrics["hits"] = self.hits
+        metrics["misses"] = self.misses
+        metrics["hit_rate"] = self.hits / (self.hits + self.misses) if self.hits + self.misses else 0
+        metrics["evictions"] = self.evictions
+        metrics["expirations"] = self.expirations
+        return metrics
+
+    def _remove(self, key):
+        response, expires, size = self.entries.pop(key)
+        self.bytes -= size
+
+
+class PhaseTimers:
+    '''
+        Histograms of the time run() spends in each phase of a call:
+
+            parse     - json.loads of the body
+            cache     - Hashing the payload and looking it up, with the cache on
+            inference - Scoring the records, including the micro batcher queue
+            serialize - json.dumps of the results
+            total     - The whole call
+
+        Buckets are fixed, as for a Prometheus histogram. A call's phases are
+        recorded under a lock, so a snapshot's bucket counts always add up to
+        its count.
+    '''
+    BUCKETS = [0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+    def __init__(self):
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def record(self, phases):
+        '''
+            Record a call, phases is {phase name : seconds}
+        '''
+        with self.lock:
+            for name, seconds in phases.items():
+                histogram = self.phases.get(name)
+                if histogram is None:
+                    histogram = self.phases.setdefault(name, [[0] * (len(PhaseTimers.BUCKETS) + 1), 0.0, 0])
+                histogram[0][bisect_left(PhaseTimers.BUCKETS, seconds)] += 1
+                histogram[1] += seconds
+                histogram[2] += 1
+
+    def snapshot(self):
+        '''
+            Copy of the histograms, {phase : [counts, total, count]}
+        '''
+        with self.lock:
+            return {name : [list(counts), total, count] for name, [counts, total, count] in self.phases.items()}
+
+    def metrics(self):
+        '''
+            {phase : {count, mean}} with mean in seconds
+        '''
+        return {name : {"count" : count, "mean" : total / count} for name, [counts, total, count] in self.snapshot().items() if count}
+
+    def prometheus(self):
+        '''
+            Snapshot of the histograms in the Prometheus text format
+        '''
+        lines = [
+            "# HELP scoring_phase_seconds Time run() spends in each phase of a call.",
+            "# TYPE scoring_phase_seconds histogram"]
+        phases = self.snapshot()
+        for name in sorted(phases):
+            counts, total, count = phases[name]
+            cumulative = 0
+            for bound, bucket in zip(PhaseTimers.BUCKETS + ["+Inf"], counts):
+                cumulative += bucket
+                lines.append('scoring_phase_seconds_bucket{{phase="{}",le="{}"}} {}'.format(name, bound, cumulative))
+            lines.append('scoring_phase_seconds_sum{{phase="{}"}} {}'.format(name, total))
+            lines.append('scoring_phase_seconds_count{{phase="{}"}} {}'.format(name, count))
+        return "\n".join(lines) + "\n"
+
+
+def typeName(value):
+    for name, types in JSON_TYPES.items():
+        if type(value) in types:
+            return name
+    return type(value).__name__
+
+def compileSchema(schema, path = ""):
+    '''
+        Returns a function that validates a parsed value against schema and 
+        returns None, or a message naming the field that failed and why.
+    '''
+    prefix = path + ": " if path else ""
+    expected = schema.get("type")
+    types = JSON_TYPES[expected] if expected else None
+    required = schema.get("required", [])
+    properties = [[key, compileSchema(value, path + "." + key if path else key)] for key, value in schema.get("properties", {}).items()]
+
+    def validate(value):
+        if types and type(value) not in types:
+            return "{}expected {}, got {}".format(prefix, expected, typeName(value))
+        for key in required:
+            if key not in value:
+                return "{}missing required field {}".format(prefix, key)
+        for key, validator in properties:
+            if key in value:
+                error = validator(value[key])
+                if error:
+                    return error
+        return None
+    return validate
+
+def loadModel():
+    '''
+        Deserialize the model. 
+
+        Typically this is where the model file (pkl) is loaded, but for this 
+        example there is no model file. SCORING_MODEL_LOAD_SECONDS (default 0)
+        stands in for the time a real model takes to load.
+    '''
+    time.sleep(float(os.environ.get("SCORING_MODEL_LOAD_SECONDS", "0")))
+    return {"message" : "'s not here....."}
+
+def warmUp(calls):
+    '''
+        Score calls synthetic records so caches and lazily initialized code
+        are warm before the first real call.
+    '''
+    for i in range(calls):
+        scoreRecords([{"name" : "warmup" + str(i)}])
+
+def loadAndWarmUp():
+    '''
+        Load the model, run the warm-up and mark the service ready, once. 
+        Phase timings (seconds) are kept in init_timings and logged, ready_after
+        is the time from the start of init() to ready.
+
+        A failure is kept in load_error and logged. It is raised again except 
+        in background mode, where nothing would catch it on the loader thread.
+    '''
+    global model, load_error
+
+    with load_lock:
+        if ready.is_set():
+            return
+
+        try:
+            start = time.perf_counter()
+            model = loadModel()
+            model_loaded = time.perf_counter()
+            warmUp(int(os.environ.get("SCORING_WARMUP_CALLS", "0")))
+            warmed = time.perf_counter()
+        except Exception as e:
+            load_error = "{}: {}".format(type(e).__name__, e)
+            print("Model load failed:", load_error)
+            loaded.set()
+            if load_mode != "background":
+                raise
+            return
+
+        load_error = None
+        init_timings["load"] = model_loaded - start
+        init_timings["warmup"] = warmed - model_loaded
+        init_timings["ready_after"] = warmed - init_timings["init_start"]
+        ready.set()
+        loaded.set()
+        print("Model ready:", codec.dumps(status()["timings"]))
 
 def init():
     '''
         Called when an instance of the container is stood up. 
 
-        Typically this is where the model file (pkl) is deserialized, 
-        but for this example we aren't even going to use it. 
+        SCORING_MODEL_LOAD sets when the model is loaded:
+            eager      - (default) In init(), the container does not answer until
+                         the model is loaded.
+            background - On a thread started by init(), calls that arrive before
+                         the model is ready wait up to SCORING_READY_TIMEOUT_SECONDS
+                         (default 30) for it and then fail.
+            lazy       - On the first call to run().
+
+        After loading, SCORING_WARMUP_CALLS (default 0) synthetic records are
+        scored before the service is marked ready.
+
+        Setting the environment variable SCORING_BATCH_MAX_RECORDS above 1 turns
+        on the micro batcher, concurrent calls are then scored together in 
+        batches of up to that many records, waiting at most 
+        SCORING_BATCH_MAX_WAIT_MS (default 5) milliseconds to fill a batch. 
+        SCORING_BATCH_LOG_SECONDS (default 60) sets how often batcher metrics
+        are logged.
+
+        Setting SCORING_CACHE_ENTRIES above 0 turns on the response cache, it
+        holds up to that many responses and SCORING_CACHE_BYTES (default 64MB)
+        of response text, each for SCORING_CACHE_TTL_SECONDS (default 300).
+
+        Setting SCORING_PHASE_TIMERS to 1 times the phases of every call into 
+        histograms, see prometheusMetrics(). Setting SCORING_TIMING_HEADER to 1
+        also returns the phase times of each call in a Server-Timing header.
+
+        SCORING_JSON_CODEC chooses the JSON codec, auto (default), orjson or 
+        json, and RECORD_SCHEMA is compiled into the record validator.
+
+        SCORING_STREAM_CHUNK_RECORDS (default 500) sets how many records the 
+        streaming mode scores at a time, see scoreStream().
+    '''
+    global batcher, cache, timers, timing_header, load_mode, codec, validateRecord, stream_chunk_records
+
+    init_timings["init_start"] = time.perf_counter()
+    codec = JsonCodec(os.environ.get("SCORING_JSON_CODEC", "auto"))
+    validateRecord = compileSchema(RECORD_SCHEMA)
+    stream_chunk_records = max(int(os.environ.get("SCORING_STREAM_CHUNK_RECORDS", "500")), 1)
+
+    load_mode = os.environ.get("SCORING_MODEL_LOAD", "eager")
+    if load_mode == "eager":
+        loadAndWarmUp()
+    elif load_mode == "background":
+        loader = threading.Thread(target = loadAndWarmUp)
+        loader.daemon = True
+        loader.start()
+    elif load_mode != "lazy":
+        raise Exception("Unknown SCORING_MODEL_LOAD " + load_mode)
+    init_timings["init"] = time.perf_counter() - init_timings["init_start"]
+
+    max_records = int(os.environ.get("SCORING_BATCH_MAX_RECORDS", "1"))
+    if max_records > 1:
+        batcher = MicroBatcher(
+            scoreRecords, 
+            max_records, 
+            float(os.environ.get("SCORING_BATCH_MAX_WAIT_MS", "5")) / 1000.0,
+            float(os.environ.get("SCORING_BATCH_LOG_SECONDS", "60")))
+
+    max_entries = int(os.environ.get("SCORING_CACHE_ENTRIES", "0"))
+    if max_entries > 0:
+        cache = ResponseCache(
+            max_entries,
+            int(os.environ.get("SCORING_CACHE_BYTES", str(64 * 1024 * 1024))),
+            float(os.environ.get("SCORING_CACHE_TTL_SECONDS", "300")))
+
+    timing_header = os.environ.get("SCORING_TIMING_HEADER", "0") == "1"
+    if timing_header or os.environ.get("SCORING_PHASE_TIMERS", "0") == "1":
+        timers = PhaseTimers()
+
+def modelReady():
     '''
-    pass
+        True when the model is ready. In lazy mode the model is loaded now, in 
+        background mode this waits up to SCORING_READY_TIMEOUT_SECONDS for it 
+        and is False at once if the load failed.
+    '''
+    if ready.is_set():
+        return True
+    if load_mode == "lazy":
+        loadAndWarmUp()
+        return True
+    loaded.wait(float(os.environ.get("SCORING_READY_TIMEOUT_SECONDS", "30")))
+    return ready.is_set()
+
+def modelNotReady():
+    '''
+        Error returned to a call when the model is not ready
+    '''
+    if load_error:
+        return "Model failed to load, " + load_error
+    return "Model is not loaded yet"
+
+def metrics():
+    '''
+        Metrics of the micro batcher, the response cache and the phase timers,
+        each is None when it is not turned on
+    '''
+    return {
+        "batcher" : batcher.metrics() if batcher else None,
+        "cache" : cache.metrics() if cache else None,
+        "phases" : timers.metrics() if timers else None
+    }
+
+def prometheusMetrics():
+    '''
+        Phase timer histograms in the Prometheus text format, empty when the 
+        timers are not turned on
+    '''
+    return timers.prometheus() if timers else ""
+
+def status():
+    '''
+        Readiness of the model, why it failed to load if it did, and the init 
+        phase timings in seconds
+    '''
+    timings = {key : value for key, value in init_timings.items() if key != "init_start"}
+    return {"ready" : ready.is_set(), "mode" : load_mode, "error" : load_error, "codec" : codec.name, "timings" : timings}
+
+def scoreRecord(record):
+    '''
+        Score a single {"name" : ...} record.
+    '''
+    return {"GoAway": record["name"] + model["message"]}
+
+def scoreRecords(records):
+    '''
+        Score a list of records, the results are in the same order. A record 
+        that is not valid or cannot be scored gets an error in its place 
+        without failing the rest of the batch. 
+    '''
+    results = []
+    for record in records:
+        error = validateRecord(record)
+        if error:
+            results.append({"error": error})
+            continue
+        try:
+            results.append(scoreRecord(record))
+        except Exception as e:
+            results.append({"error": str(e)})
+    return results
+
+def scoreStream(lines, chunk_records):
+    '''
+        Score newline delimited JSON records, one record per line, and yield
+        the results as newline delimited JSON, one result per line in the same
+        order. Blank lines are skipped.
+
+        lines is any iterable of lines (str or bytes), such as the request 
+        stream, and is read chunk_records lines at a time. Only one chunk of
+        records and results is held at once, so memory is bounded by the chunk
+        size and not by the size of the request. A line that is not valid JSON
+        or not a valid record gets an error in its place.
+    '''
+    chunk = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            chunk.append(codec.loads(line))
+        except ValueError as e:
+            '''
+                Invalid JSON, or with the json codec bytes that are not UTF-8
+            '''
+            chunk.append(e)
+        if len(chunk) >= chunk_records:
+            yield scoreChunk(chunk)
+            chunk = []
+    if chunk:
+        yield scoreChunk(chunk)
+
+def scoreChunk(chunk):
+    '''
+        Newline delimited results of a chunk of parsed records, JSON errors 
+        included as exceptions
+    '''
+    records = [record for record in chunk if not isinstance(record, Exception)]
+    results = iter(scoreRecords(records))
+    lines = []
+    for record in chunk:
+        if isinstance(record, Exception):
+            lines.append(codec.dumps({"error": "Invalid JSON, " + str(record)}))
+        else:
+            lines.append(codec.dumps(next(results)))
+    return "\n".join(lines) + "\n"
+
+def predict(data):
+    '''
+        Results for a parsed payload, a record or a list of records
+    '''
+    if not isinstance(data, (dict, list)):
+        return {"error": "expected a record or a list of records, got " + typeName(data)}
+    if batcher:
+        results = batcher.submit(data if isinstance(data, list) else [data])
+        return results if isinstance(data, list) else results[0]
+    if isinstance(data, list):
+        return scoreRecords(data)
+    error = validateRecord(data)
+    return {"error": error} if error else scoreRecord(data)
+
+def timedRun(raw_data):
+    '''
+        run() with the phase timers on
+    '''
+    start = time.perf_counter()
+    data = codec.loads(raw_data)
+    parsed = time.perf_counter()
+    phases = {"parse" : parsed - start}
+
+    response = None
+    if cache:
+        key = cache.key(data)
+        response = cache.get(key)
+        looked_up = time.perf_counter()
+        phases["cache"] = looked_up - parsed
+        parsed = looked_up
+
+    if response is None:
+        results = predict(data)
+        predicted = time.perf_counter()
+        response = codec.dumps(results)
+        serialized = time.perf_counter()
+        phases["inference"] = predicted - parsed
+        phases["serialize"] = serialized - predicted
+        if cache:
+            cache.put(key, response)
+
+    phases["total"] = time.perf_counter() - start
+    timers.record(phases)
+
+    if timing_header:
+        header = ", ".join(["{};dur={:.3f}".format(name, seconds * 1000) for name, seconds in phases.items()])
+        return AMLResponse(response, 200, {"Server-Timing" : header})
+    return response
 
 def run(raw_data):
     '''
         Entry point for REST API when calling the service.
+
+        The body is either a single record, {"name" : ...}, or a list of 
+        records, [{"name" : ...}, ...], which returns a list of results in
+        the same order. With the micro batcher on, the records are scored in
+        a batch with those of other concurrent calls. With the response cache
+        on, a payload seen before is answered from the cache. With the timing
+        header on, the response is an AMLResponse carrying a Server-Timing 
+        header.
+
+        Bodies that are not valid JSON, and records that do not match 
+        RECORD_SCHEMA, get an error saying where and why.
+
+        When raw_data is the HTTP request (see SCORING_STREAMING below) and its
+        content type is application/x-ndjson, it is scored in the streaming
+        mode. Records are read from the request and the results are written
+        back as they are scored, see scoreStream(). The micro batcher, 
+        response cache and phase timers are not used in the streaming mode.
     '''
     try:
-        name = json.loads(raw_data)["name"]
-        return json.dumps({"GoAway": name + "'s not here....."})
+        if hasattr(raw_data, "stream"):
+            if raw_data.headers.get("Content-Type", "").startswith(NDJSON):
+                if not modelReady():
+                    return codec.dumps({"error": modelNotReady()})
+                return AMLResponse(scoreStream(raw_data.stream, stream_chunk_records), 200, {"Content-Type" : NDJSON}, json_str = True)
+            raw_data = raw_data.get_data(as_text = True)
+
+        if not modelReady():
+            return codec.dumps({"error": modelNotReady()})
+
+        if timers:
+            return timedRun(raw_data)
+
+        data = codec.loads(raw_data)
+        if cache:
+            key = cache.key(data)
+            response = cache.get(key)
+            if response is None:
+                response = codec.dumps(predict(data))
+                cache.put(key, response)
+            return response
+        return codec.dumps(predict(data))
+    except json.JSONDecodeError as e:
+        return codec.dumps({"error": "Invalid JSON, " + str(e)})
     except Exception as e:
         result = str(e)
-        return json.dumps({"error": result})
+        return codec.dumps({"error": result})
+
+
+'''
+    The container passes run() the body as a string. Setting SCORING_STREAMING to
+    1 in the service's environment has it pass the HTTP request instead, so 
+    application/x-ndjson requests can be read as a stream.
+'''
+if rawhttp and os.environ.get("SCORING_STREAMING", "0") == "1":
+    run = rawhttp(run)
 
 
 if __name__ == "__main__":
@@ -29,3 +773,14 @@ if __name__ == "__main__":
     init()
     result = run(json.dumps( {"name": "Dave"}))
     print("RESULT:", result)
+    result = run(json.dumps( [{"name": "Dave"}, {"name": "Sue"}, {"nombre": "Dan"}]))
+    print("BATCH RESULT:", result)
+    result = run(json.dumps( [{"name": 7}, "Dan"]))
+    print("INVALID RESULT:", result)
+    result = run('{"name": "Dave"')
+    print("MALFORMED RESULT:", result)
+    lines = ['{"name": "Dave"}', '{"name": "Sue"}', '{"nombre": "Dan"}', '{"name"']
+    print("STREAM RESULT:", "".join(scoreStream(lines, 2)))
+    print("STATUS:", json.dumps(status()))
+    print("METRICS:", json.dumps(metrics()))
+    print(prometheusMetrics())
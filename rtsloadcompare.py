@@ -0,0 +1,103 @@
+'''
+    Compare two load test runs saved with rtsloadtest.py -archive. 
+
+    Read the function loadArguments() to determine what parameters to pass in. 
+
+    Flow:
+        1. Load the baseline and candidate archives.
+        2. For the mean and the 50th, 90th, 99th and 99.9th percentile latency of 
+            successful calls report the change from the baseline, a bootstrap 
+            confidence interval of that change and whether it is significant. A 
+            Mann-Whitney U test of the two latency distributions is reported as well
+            (see loadtest/compare.py).
+        3. Fail the candidate if a statistic is significantly slower by more than
+            its threshold or the error rate rose by more than max_error_increase.
+            The program exits with 1 on a failure so it can gate a build.
+'''
+import sys 
+import argparse 
+from loadtest.archive import loadArchive
+from loadtest.compare import compareRuns
+
+
+def loadArguments(sys_args):
+    '''
+        baseline = Archive of the run to compare against.
+        candidate = Archive of the new run.
+        max_mean_increase, max_p50_increase, max_p90_increase, max_p99_increase,
+        max_p999_increase = Largest allowed slow down in percent for each statistic,
+                            a negative value turns the check off.
+        max_error_increase = Largest allowed rise in the error rate (0.01 = 1 point).
+        bootstrap = Number of bootstrap resamples.
+        confidence = Confidence level of the intervals.
+    '''
+    parser = argparse.ArgumentParser(description='Load test run comparison.') 
+    parser.add_argument("-baseline", required=True, type=str, help="Baseline run archive") 
+    parser.add_argument("-candidate", required=True, type=str, help="Candidate run archive") 
+    parser.add_argument("-max_mean_increase", required=False, default=10, type=float, help="Allowed mean latency increase in percent") 
+    parser.add_argument("-max_p50_increase", required=False, default=10, type=float, help="Allowed p50 latency increase in percent") 
+    parser.add_argument("-max_p90_increase", required=False, default=10, type=float, help="Allowed p90 latency increase in percent") 
+    parser.add_argument("-max_p99_increase", required=False, default=20, type=float, help="Allowed p99 latency increase in percent") 
+    parser.add_argument("-max_p999_increase", required=False, default=-1, type=float, help="Allowed p99.9 latency increase in percent") 
+    parser.add_argument("-max_error_increase", required=False, default=0.01, type=float, help="Allowed error rate increase") 
+    parser.add_argument("-bootstrap", required=False, default=200, type=int, help="Bootstrap resamples") 
+    parser.add_argument("-confidence", required=False, default=0.95, type=float, help="Confidence level") 
+
+    return parser.parse_args(sys_args)
+
+def buildThresholds(configuration):
+    '''
+        {statistic : allowed increase in percent} for the enabled checks
+    '''
+    thresholds = {}
+    limits = {
+        "mean" : configuration.max_mean_increase,
+        "p50" : configuration.max_p50_increase,
+        "p90" : configuration.max_p90_increase,
+        "p99" : configuration.max_p99_increase,
+        "p99.9" : configuration.max_p999_increase
+    }
+    for name in limits.keys():
+        if limits[name] >= 0:
+            thresholds[name] = limits[name]
+    return thresholds
+
+def printComparison(comparison):
+    print("Latency (seconds, successful calls):")
+    print("     {:<8}{:>12}{:>12}{:>10}{:>26}  {}".format("", "baseline", "candidate", "change", "interval", "result"))
+    for row in comparison["rows"]:
+        result = "REGRESSED" if row["regressed"] else ("significant" if row["significant"] else "")
+        interval = "[{:+.6f}, {:+.6f}]".format(row["interval"][0], row["interval"][1])
+        print("     {:<8}{:>12.6f}{:>12.6f}{:>9.1f}%{:>26}  {}".format(
+            row["statistic"], row["baseline"], row["candidate"], row["delta_percent"], interval, result))
+
+    print("Error Rate:")
+    print("     Baseline  : ", comparison["baseline_error_rate"])
+    print("     Candidate : ", comparison["candidate_error_rate"])
+    print("     Regressed : ", comparison["error_rate_regressed"])
+    print("Throughput (RPS):")
+    print("     Baseline  : ", comparison["baseline_rps"])
+    print("     Candidate : ", comparison["candidate_rps"])
+    print("Mann-Whitney U:")
+    print("     U         : ", comparison["mann_whitney_u"])
+    print("     p value   : ", comparison["mann_whitney_p"])
+    print("Result : ", "PASS" if comparison["passed"] else "FAIL")
+
+
+if __name__ == "__main__":
+
+    configuration = loadArguments(sys.argv[1:])
+
+    baseline = loadArchive(configuration.baseline)
+    candidate = loadArchive(configuration.candidate)
+
+    comparison = compareRuns(
+        baseline, 
+        candidate, 
+        buildThresholds(configuration), 
+        configuration.max_error_increase, 
+        configuration.bootstrap, 
+        configuration.confidence)
+
+    printComparison(comparison)
+    sys.exit(0 if comparison["passed"] else 1)
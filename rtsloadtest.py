@@ -7,16 +7,57 @@
         1. Create and start t number of threads where t is identified in the parameters.
             Each thread will run for i iterations (calls to the endpoint) where i is identified
             in the parameters.
+
+            With -engine async the t simulated users are coroutines on a single event
+            loop instead of threads, sharing a pool of -connections keep-alive connections
+            (see loadtest/asyncrun.py). 
+
+            With -rate greater than zero the test is open loop instead. Calls are sent at
+            a target rate for -duration seconds whether or not earlier calls have returned,
+            latency is measured from the time each call was scheduled, and the number
+            of late and dropped calls is reported. 
+
+            Threads make their calls through their own keep-alive requests.Session so the
+            connection (and TLS handshake) is reused between calls. -new_connection forces
+            a new connection for every call on either engine to measure that cost. 
         2. Upon completion of all threads collect statistics.
             - All up stats on all calls from all threads
             - Individual thread statistics
             - Each stats bundle contains
                 Total Number of Calls
                 Succesful Number of Calls
+                Failed Number of Calls
                 Average Latency (seconds)
                 Min Latency (seconds)
                 Max Latency (seconds)
+                50th, 90th, 99th and 99.9th Percentile Latency (seconds)
+
+            Each thread records into its own fixed size latency histogram (see 
+            loadtest/histogram.py) so memory use does not grow with the length of 
+            the run. The global stats come from merging the thread histograms.
+
+            With -raw every call is also kept in NumPy arrays (see loadtest/results.py)
+            and the stats, now with exact percentiles and a per status breakdown, are
+            computed from those in a single vectorized pass.
+
+            Each call's time is also split into connection phases, aggregated in 
+            their own histograms and reported after the global stats:
+                schedule - open loop only, scheduled time until the call started
+                pool_wait, dns, connect, tls - async engine only, the last three 
+                                               only when a new connection is made
+                ttfb     - request sent until the response status line arrives, 
+                           close to the time spent in scoring.run 
+                transfer - reading the rest of the response
+            The thread engine can only see ttfb (which then includes any new 
+            connection) and transfer.
+
+            Every call is also sorted by outcome, ok, throttled (429/503), 4xx, 5xx, 
+            timeout, connection or other (see loadtest/errors.py), and each outcome 
+            gets its own count and latency distribution. Failed calls are recorded 
+            with their real latency, and status 0 when there was no response.
         3. Print the results to the console. 
+        4. With -archive save the raw calls and the arguments to a .npz file (see 
+            loadtest/archive.py) that rtsloadcompare.py can compare against another run.
 '''
 
 from threading import * 
@@ -26,20 +67,32 @@ import argparse
 import time 
 import requests
 import json
-import collections
 import random
-import statistics
+import math
+import multiprocessing
+import queue
+from loadtest.asyncrun import AsyncRun, OpenLoopRun
+from loadtest.asyncclient import PHASES
+from loadtest.histogram import LatencyHistogram, LatencyRecorder
+from loadtest.distributed import Coordinator, Agent
+from loadtest.corpus import FixedPayload, PayloadCorpus, BatchPayload
+from loadtest.results import ResultStore, computeStatistics
+from loadtest.archive import saveArchive
+from loadtest.profiles import LoadProfile
+from loadtest.search import SaturationSearch
+from loadtest.adaptive import ConcurrencyController
+from loadtest.errors import RetryPolicy, statusKind, exceptionKind, KINDS
+from loadtest.timeseries import LiveMetrics, WindowForwarder, popWindows, COMPLETE_LAG
 
-# Named tuple to collect from each call
-test_point = collections.namedtuple('test_point', 'thread status elapsed')
-# Collection of each call made
-test_collection = []
-# Global lock to protect collection
+# Latency recorder for each thread, keyed on thread id
+thread_recorders = {}
+# Every call when -raw is used, otherwise None
+result_store = None
+# Set when recorders also keep per second windows for live metrics
+windowed_recorders = False
+# Global lock to protect the recorder collection
 test_collection_lock = RLock()
 
-# Counter of running threads
-running_threads = 0
-
 # Headers for every call
 api_headers = {}
 
@@ -52,6 +105,71 @@ def loadArguments(sys_args):
         k = API Key for the web service
         t = Number of threads to run
         i = Number of calls to make per thread. 
+        engine = thread (default) runs one OS thread per user, async runs each user 
+                 as a coroutine on a single event loop.
+        connections = Size of the keep-alive connection pool used by the async engine.
+        http2 = If present, calls are multiplexed over at most connections HTTP/2 
+                connections on the async engine (needs httpx[http2]).
+        rate = Target requests per second for an open loop test, 0 (default) runs the
+               closed loop test using t and i.
+        duration = Length of an open loop test in seconds.
+        arrival = fixed or poisson spacing of open loop calls.
+        max_outstanding = Open loop calls in flight before new calls are dropped.
+        late_ms = Open loop calls whose first attempt gets a connection more than this 
+                  many milliseconds after their scheduled time are counted as late.
+        new_connection = If present, make a new connection for every call instead of 
+                         reusing keep-alive connections.
+        processes = Number of worker processes to split the test across.
+        role = standalone (default) runs the test here. coordinator waits for agents to 
+               connect and hands each a share of the test. agent connects to a 
+               coordinator and runs whatever plan it is given.
+        host, port = Address the coordinator listens on and agents connect to.
+        agents = Number of agents the coordinator waits for.
+        report_interval = Seconds between agent summaries.
+        corpus = JSON lines file of request bodies to replay instead of the generated
+                 {'name' : ...} payloads.
+        corpus_mode = sequential, random or weighted replay of the corpus.
+        corpus_weight_key = Field holding each line's weight for weighted replay.
+        batch_size = Records sent in each call as a JSON array, 1 (default) sends a 
+                     single record.
+        ndjson = If present, send the records of each call as newline delimited JSON
+                 (application/x-ndjson) for the scoring script's streaming mode.
+        live = If present, print one second windows of rps, errors and latency 
+               percentiles while the test runs.
+        timeseries = File to write the one second windows to, JSON lines if the name 
+                     ends in .jsonl otherwise CSV.
+        profile = constant (default), ramp, step or spike. Any other than constant shapes 
+                  the open loop rate (when rate > 0) or the number of active users 
+                  (otherwise, on the async engine) over duration seconds.
+        profile_start, profile_end = Rate or users the profile moves between.
+        profile_steps = Number of steps in a step profile.
+        spike_start, spike_length = When a spike profile jumps to profile_end and for how 
+                                    many seconds.
+        search = none (default), rate or users. Raise the open loop rate or the number of 
+                 users stage by stage until slo_p99_ms or error_budget is broken, then 
+                 report the maximum sustainable throughput and the latency knee.
+        search_start, search_step = First stage target and the increase per stage.
+        search_stages = Most stages to run.
+        stage_duration = Seconds per search stage.
+        slo_p99_ms = p99 latency limit in milliseconds for a passing stage.
+        error_budget = Largest fraction of failed calls for a passing stage.
+        adaptive = none (default), aimd or gradient. Instead of t users, let a controller
+                   change the number of calls in flight every adaptive_interval seconds 
+                   for duration seconds, keeping p99 under slo_p99_ms and errors under 
+                   error_budget, and report the concurrency it settled on.
+        adaptive_min, adaptive_max = Limits of the number of calls in flight.
+        adaptive_interval = Seconds between adjustments.
+        adaptive_expect = Exit with 1 when the settled concurrency is lower than this, 
+                          or the controller did not converge, for capacity checks 
+                          in a build.
+        connect_timeout, read_timeout = Seconds to wait for a connection and for a response,
+                                        0 to wait forever.
+        retries = Times a timed out, reset or throttled (429/503) call is retried.
+        retry_budget = Retries allowed as a fraction of all calls made.
+        raw = If present, keep every call for exact statistics and a per status 
+              breakdown. Memory grows with the number of calls.
+        archive = File (.npz) to save the raw calls and arguments of the run to, turns 
+                  on raw. Compare two archives with rtsloadcompare.py.
     '''
     global api_headers
 
@@ -60,14 +178,120 @@ def loadArguments(sys_args):
     parser.add_argument("-k", required=False, default="oZ67iku9ddYtkJGYwGGNCZc2psT27qoC", type=str, help="Web Service Key") 
     parser.add_argument("-t", required=False, default=20, type=int, help="Thread Count") 
     parser.add_argument("-i", required=False, default=1, type=int, help="Thread Iterations") 
+    parser.add_argument("-engine", required=False, default="thread", choices=["thread", "async"], type=str, help="Load engine") 
+    parser.add_argument("-connections", required=False, default=100, type=int, help="Async engine connection pool size") 
+    parser.add_argument("-http2", required=False, default=False, action="store_true", help="Multiplex calls over HTTP/2") 
+    parser.add_argument("-rate", required=False, default=0, type=float, help="Open loop target requests per second") 
+    parser.add_argument("-duration", required=False, default=60, type=float, help="Open loop test length in seconds") 
+    parser.add_argument("-arrival", required=False, default="fixed", choices=["fixed", "poisson"], type=str, help="Open loop arrival spacing") 
+    parser.add_argument("-max_outstanding", required=False, default=1000, type=int, help="Open loop calls in flight before dropping") 
+    parser.add_argument("-late_ms", required=False, default=10, type=float, help="Open loop late threshold in milliseconds") 
+    parser.add_argument("-new_connection", required=False, default=False, action="store_true", help="New connection for every call") 
+    parser.add_argument("-processes", required=False, default=1, type=int, help="Worker process count") 
+    parser.add_argument("-role", required=False, default="standalone", choices=["standalone", "coordinator", "agent"], type=str, help="Distributed test role") 
+    parser.add_argument("-host", required=False, default="127.0.0.1", type=str, help="Coordinator address") 
+    parser.add_argument("-port", required=False, default=5557, type=int, help="Coordinator port") 
+    parser.add_argument("-agents", required=False, default=1, type=int, help="Number of agents") 
+    parser.add_argument("-report_interval", required=False, default=5, type=float, help="Seconds between agent summaries") 
+    parser.add_argument("-corpus", required=False, default=None, type=str, help="JSON lines file of request bodies") 
+    parser.add_argument("-corpus_mode", required=False, default="sequential", choices=PayloadCorpus.modes, type=str, help="Corpus replay order") 
+    parser.add_argument("-corpus_weight_key", required=False, default="weight", type=str, help="Corpus weight field") 
+    parser.add_argument("-batch_size", required=False, default=1, type=int, help="Records per call") 
+    parser.add_argument("-ndjson", required=False, default=False, action="store_true", help="Send records as newline delimited JSON") 
+    parser.add_argument("-live", required=False, default=False, action="store_true", help="Print live one second metrics") 
+    parser.add_argument("-timeseries", required=False, default=None, type=str, help="Live metrics output file (.csv or .jsonl)") 
+    parser.add_argument("-profile", required=False, default="constant", choices=LoadProfile.kinds, type=str, help="Load profile") 
+    parser.add_argument("-profile_start", required=False, default=1, type=float, help="Profile starting rate or users") 
+    parser.add_argument("-profile_end", required=False, default=100, type=float, help="Profile ending rate or users") 
+    parser.add_argument("-profile_steps", required=False, default=5, type=int, help="Step profile step count") 
+    parser.add_argument("-spike_start", required=False, default=None, type=float, help="Spike profile start in seconds") 
+    parser.add_argument("-spike_length", required=False, default=10, type=float, help="Spike profile length in seconds") 
+    parser.add_argument("-search", required=False, default="none", choices=["none", "rate", "users"], type=str, help="Saturation search target") 
+    parser.add_argument("-search_start", required=False, default=10, type=float, help="First search stage target") 
+    parser.add_argument("-search_step", required=False, default=10, type=float, help="Search stage target increase") 
+    parser.add_argument("-search_stages", required=False, default=20, type=int, help="Maximum search stages") 
+    parser.add_argument("-stage_duration", required=False, default=30, type=float, help="Search stage length in seconds") 
+    parser.add_argument("-slo_p99_ms", required=False, default=500, type=float, help="Search p99 latency SLO in milliseconds") 
+    parser.add_argument("-error_budget", required=False, default=0.01, type=float, help="Search error rate budget") 
+    parser.add_argument("-adaptive", required=False, default="none", choices=["none"] + ConcurrencyController.kinds, type=str, help="Adaptive concurrency controller") 
+    parser.add_argument("-adaptive_min", required=False, default=1, type=int, help="Adaptive minimum concurrency") 
+    parser.add_argument("-adaptive_max", required=False, default=500, type=int, help="Adaptive maximum concurrency") 
+    parser.add_argument("-adaptive_interval", required=False, default=1, type=float, help="Seconds between adaptive adjustments") 
+    parser.add_argument("-adaptive_expect", required=False, default=0, type=int, help="Lowest passing settled concurrency") 
+    parser.add_argument("-connect_timeout", required=False, default=10, type=float, help="Connect timeout in seconds") 
+    parser.add_argument("-read_timeout", required=False, default=60, type=float, help="Read timeout in seconds") 
+    parser.add_argument("-retries", required=False, default=0, type=int, help="Retries for a failed call") 
+    parser.add_argument("-retry_budget", required=False, default=0.1, type=float, help="Retries allowed as a fraction of calls") 
+    parser.add_argument("-raw", required=False, default=False, action="store_true", help="Keep every call for exact statistics") 
+    parser.add_argument("-archive", required=False, default=None, type=str, help="Run archive file (.npz)") 
 
     prog_args = parser.parse_args(sys_args)
+    if prog_args.role == "coordinator" and (prog_args.search != "none" or prog_args.adaptive != "none"):
+        parser.error("search and adaptive run on this machine only and cannot be used with role coordinator")
+    if prog_args.processes > 1 and (prog_args.search != "none" or prog_args.adaptive != "none"):
+        parser.error("search and adaptive run in one process and cannot be used with processes")
+    if prog_args.archive:
+        prog_args.raw = True
 
     api_headers["Authorization"] = "Bearer " + prog_args.k
-    api_headers["Content-Type"] = "application/json"
+    api_headers["Content-Type"] = "application/x-ndjson" if prog_args.ndjson else "application/json"
 
     return prog_args
 
+def buildPayloads(configuration, users):
+    '''
+        Payload source for each of the users. 
+
+        With a corpus every user shares one memory mapped PayloadCorpus, otherwise
+        each user gets a fixed {'name' : ...} payload. Either way the bodies are
+        encoded once here so the send path never calls json.dumps.
+
+        With a batch_size over 1 every call sends a JSON array of that many 
+        records, corpus lines are joined into the array as they are. With 
+        ndjson the records are sent one per line instead.
+    '''
+    if configuration.corpus:
+        corpus = PayloadCorpus(configuration.corpus, configuration.corpus_mode, configuration.corpus_weight_key)
+        if configuration.batch_size > 1 or configuration.ndjson:
+            corpus = BatchPayload(corpus, configuration.batch_size, configuration.ndjson)
+        return [corpus] * users
+
+    names = ["Dave", "Sue", "Dan", "Joe", "Beth"]
+    payloads = []
+    for i in range(users):
+        records = [{'name' : names[random.randint(0, len(names) -1)]} for record in range(configuration.batch_size)]
+        if configuration.ndjson:
+            payloads.append(FixedPayload("".join([json.dumps(record) + "\n" for record in records]).encode("utf-8")))
+            continue
+        payload = records if configuration.batch_size > 1 else records[0]
+        payloads.append(FixedPayload(json.dumps(payload).encode("utf-8")))
+    return payloads
+
+def recordTestPoint(thread, status, elapsed, phases = None, kind = None, retries = 0):
+    '''
+        Record the result of a single call in the recorder for the thread. 
+        phases is the {phase : seconds} breakdown of the call, if known, kind 
+        the outcome of a call that got no response (status 0, see 
+        loadtest/errors.py) and retries the number of times it was retried.
+
+        Only creating a recorder needs the lock, after that each thread is the
+        only writer to its own recorder. With -raw the call is also added to the
+        thread's own buffer in the result store, again without a lock.
+    '''
+    global thread_recorders
+    global test_collection_lock
+
+    if result_store is not None:
+        result_store.append(thread, status, elapsed, time.time())
+
+    recorder = thread_recorders.get(thread)
+    if recorder is None:
+        test_collection_lock.acquire()
+        recorder = thread_recorders.setdefault(thread, LatencyRecorder(windowed_recorders))
+        test_collection_lock.release()
+
+    recorder.record(status, elapsed, phases, kind, retries)
+
 def dumpStats(stats):
     '''
         Dump out a dictionary of stats 
@@ -75,96 +299,600 @@ def dumpStats(stats):
     for key in stats.keys():
         print("    ", key, "=", stats[key])
 
-def getStatistics(collection):
+def getStatistics(recorder):
     '''
-        From a collection of test_point objects collect the following
+        From a LatencyRecorder collect the following
         - T0tal Calls
         - Succesful calls
+        - Failed calls
         - Average latency
         - Min latency
         - Maximum Latency
+        - Percentile latencies
     '''
     stats = {}
+    histogram = recorder.histogram
 
-    success = [x for x in collection if x.status == 200]
-    times = [x.elapsed for x in collection ]
-
-    stats["calls"] = len(collection)
-    stats["success"] = len(success)
-    stats["average"] = statistics.mean(times)
-    stats["min"] = min(times)
-    stats["max"] = max(times)
+    stats["calls"] = recorder.calls()
+    stats["success"] = recorder.success
+    stats["errors"] = recorder.errors
+    stats["retries"] = recorder.retries
+    stats["average"] = histogram.mean()
+    stats["min"] = histogram.min()
+    stats["max"] = histogram.max()
+    stats["p50"] = histogram.percentile(50)
+    stats["p90"] = histogram.percentile(90)
+    stats["p99"] = histogram.percentile(99)
+    stats["p99.9"] = histogram.percentile(99.9)
 
     return stats
 
 def getThreadStatistics():
     '''
-        Load statistics of the run. Two items are returned as a list
+        Load statistics of the run. Three items are returned as a list
 
         [0] = Dictionary of global stats
         [1] = Dictionary of dictionaries for each thread. 
+        [2] = Dictionary of dictionaries for each status code (-raw only)
     '''
-    global test_collection
+    global thread_recorders
+
+    if result_store is not None:
+        threads, statuses, latencies, timestamps = result_store.columns()
+        return computeStatistics(threads, statuses, latencies)
 
     '''
-        Get stats across threads
+        Get stats across threads by merging every thread histogram
     '''
-    global_stats = getStatistics(test_collection)
+    global_recorder = LatencyRecorder()
+    for tid in thread_recorders.keys():
+        global_recorder.merge(thread_recorders[tid])
+    global_stats = getStatistics(global_recorder)
 
     '''
         Get individual stats
     '''
     thread_stats = {}
-    thread_ids = [x.thread for x in test_collection]
-    thread_ids = list(set(thread_ids))
-    for tid in thread_ids:
-        thread_stats[tid] = {}
-        thread_collection = [x for x in test_collection if x.thread == tid]
-        thread_stats[tid] = getStatistics(thread_collection)
+    for tid in sorted(thread_recorders.keys()):
+        thread_stats[tid] = getStatistics(thread_recorders[tid])
+
+    return [global_stats, thread_stats, {}]
+
+def getKindStatistics():
+    '''
+        {kind : stats} for every outcome (loadtest/errors.py) seen in the run, 
+        merged across threads.
+    '''
+    merged = {}
+    for tid in thread_recorders.keys():
+        kinds = thread_recorders[tid].kinds
+        for kind in list(kinds.keys()):
+            if kind not in merged:
+                merged[kind] = LatencyHistogram()
+            merged[kind].merge(kinds[kind])
+
+    kind_stats = {}
+    for kind in KINDS:
+        if kind in merged:
+            histogram = merged[kind]
+            stats = {}
+            stats["calls"] = histogram.total_count
+            stats["average"] = histogram.mean()
+            stats["p50"] = histogram.percentile(50)
+            stats["p90"] = histogram.percentile(90)
+            stats["p99"] = histogram.percentile(99)
+            stats["max"] = histogram.max()
+            kind_stats[kind] = stats
+    return kind_stats
 
-    return [global_stats, thread_stats]
+def getPhaseStatistics():
+    '''
+        {phase : stats} for every connection phase seen in the run, merged 
+        across threads, in the order the phases happen.
+    '''
+    merged = {}
+    for tid in thread_recorders.keys():
+        phases = thread_recorders[tid].phases
+        for phase in list(phases.keys()):
+            if phase not in merged:
+                merged[phase] = LatencyHistogram()
+            merged[phase].merge(phases[phase])
+
+    phase_stats = {}
+    for phase in PHASES:
+        if phase in merged:
+            histogram = merged[phase]
+            stats = {}
+            stats["calls"] = histogram.total_count
+            stats["average"] = histogram.mean()
+            stats["p50"] = histogram.percentile(50)
+            stats["p90"] = histogram.percentile(90)
+            stats["p99"] = histogram.percentile(99)
+            stats["max"] = histogram.max()
+            phase_stats[phase] = stats
+    return phase_stats
 
 class ThreadRun(Thread): 
     '''
         Class used as a thread to run the load test against the 
         endpoint. 
+
+        payload is the payload source (loadtest/corpus.py) for the thread's calls.
+
+        Each thread owns a requests.Session so its connection is kept alive 
+        between calls. With new_connection set the session is not used and 
+        every call opens (and closes) its own connection.
+
+        timeouts is the requests (connect, read) timeout in seconds and 
+        retry_policy (loadtest/errors.py) decides which failed calls are retried.
     '''
  
-    def __init__(self, id, iterations, url, headers, payload): 
+    def __init__(self, id, iterations, url, headers, payload, new_connection = False, timeouts = None, retry_policy = None): 
         Thread.__init__(self) 
         self.id = id 
         self.iterations = iterations
         self.url = url
         self.headers = headers
         self.payload = payload
+        self.timeouts = tuple(timeouts) if timeouts else None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.session = None
+
+        if new_connection:
+            self.headers = dict(headers)
+            self.headers["Connection"] = "close"
+        else:
+            self.session = requests.Session()
 
     '''
         Calling start() runs this as well, but when you queue a thread it will 
         trigger this as well. 
     '''
     def run(self):
-        global running_threads
-        global test_collection
-        global test_collection_lock
-
         print("Staring thread", self.id)
+        post = self.session.post if self.session else requests.post
         for i in range(self.iterations):
-            try:
-                response = requests.post(url = self.url, headers = self.headers, data = json.dumps(self.payload))
-                current_test = test_point( self.id, response.status_code, response.elapsed.total_seconds())
-            except Exception as ex:
-                print(self.id, ex)
-                print(str(ex))
-                current_test = test_point( self.id, 500, 1)
+            body = self.payload.next()
+            self.retry_policy.call()
+            start = time.perf_counter()
+            attempt = 0
+            while True:
+                try:
+                    '''
+                        Stream the response so elapsed (request sent until the headers
+                        are parsed) and reading the body can be timed separately.
+                    '''
+                    response = post(url = self.url, headers = self.headers, data = body, stream = True, timeout = self.timeouts)
+                    headers_read = time.perf_counter()
+                    response.content
+                    status = response.status_code
+                    kind = statusKind(status)
+                    phases = {"ttfb" : response.elapsed.total_seconds(), "transfer" : time.perf_counter() - headers_read}
+                except Exception as ex:
+                    status = 0
+                    kind = exceptionKind(ex)
+                    phases = None
+                    error = ex
+                if kind == "ok" or not self.retry_policy.allowRetry(kind, attempt):
+                    break
+                attempt += 1
 
+            if status == 0:
+                print(self.id, kind, error)
+            recordTestPoint(self.id, status, time.perf_counter() - start, phases, kind, attempt)
 
-            test_collection_lock.acquire()
-            test_collection.append(current_test)
-            test_collection_lock.release()
+        if self.session:
+            self.session.close()
 
-        test_collection_lock.acquire()
-        running_threads -= 1
-        test_collection_lock.release()
+
+def mergeScheduleStatistics(schedule_stats):
+    '''
+        Combine the open loop schedule stats from several processes
+    '''
+    merged = None
+    for stats in schedule_stats:
+        if stats is None:
+            continue
+        if merged is None:
+            merged = dict(stats)
+        else:
+            for key in ["target_rps", "scheduled", "late", "dropped"]:
+                merged[key] += stats[key]
+    return merged
+
+def buildProfile(configuration, share):
+    '''
+        The configured LoadProfile scaled to this process's share of the load,
+        None for a constant load.
+    '''
+    if configuration.profile == "constant":
+        return None
+
+    profile = LoadProfile(
+        configuration.profile, 
+        configuration.profile_start, 
+        configuration.profile_end, 
+        configuration.duration, 
+        configuration.profile_steps, 
+        configuration.spike_start, 
+        configuration.spike_length)
+    return profile.scaled(share)
+
+def buildTimeouts(configuration):
+    '''
+        [connect, read] timeouts in seconds, None for no timeout
+    '''
+    connect = configuration.connect_timeout if configuration.connect_timeout > 0 else None
+    read = configuration.read_timeout if configuration.read_timeout > 0 else None
+    return [connect, read]
+
+def buildRetryPolicy(configuration):
+    '''
+        One policy is shared by every worker in the process so the retry budget
+        covers all of their calls.
+    '''
+    return RetryPolicy(configuration.retries, configuration.retry_budget)
+
+def runLoadTest(configuration, headers, users, first_id, rate):
+    '''
+        Run the configured test in this process for users users numbered from 
+        first_id, or an open loop test at rate. Results are recorded in thread_recorders.
+
+        A load profile is split between processes and agents the same way as the 
+        users (or rate) they are given.
+
+        Returns the open loop schedule stats, or None for a closed loop test.
+    '''
+    global windowed_recorders
+    global result_store
+
+    windowed_recorders = configuration.live or configuration.timeseries is not None
+    if configuration.raw and result_store is None:
+        result_store = ResultStore()
+
+    profile = None
+    if rate > 0:
+        profile = buildProfile(configuration, rate / configuration.rate)
+        users = max(users, 1)
+    elif configuration.profile != "constant":
+        profile = buildProfile(configuration, users / configuration.t)
+        users = int(math.ceil(profile.peak()))
+
+    payloads = buildPayloads(configuration, users)
+    timeouts = buildTimeouts(configuration)
+    retry_policy = buildRetryPolicy(configuration)
+
+    if rate > 0:
+        '''
+            Open loop test, always runs on the async engine.
+        '''
+        open_loop = OpenLoopRun(
+            rate, 
+            configuration.duration, 
+            configuration.arrival, 
+            configuration.u, 
+            headers, 
+            payloads, 
+            configuration.connections, 
+            configuration.max_outstanding, 
+            configuration.late_ms / 1000.0, 
+            recordTestPoint, 
+            id = first_id,
+            keep_alive = not configuration.new_connection,
+            profile = profile,
+            timeouts = timeouts,
+            retry_policy = retry_policy,
+            http2 = configuration.http2)
+        open_loop.run()
+        return open_loop.getScheduleStatistics()
+
+    if profile:
+        '''
+            Enough users for the peak of the profile run on the async engine for
+            duration seconds, the profile decides how many are calling at a time.
+        '''
+        AsyncRun(users, 0, configuration.u, headers, payloads, configuration.connections, recordTestPoint, not configuration.new_connection, first_id, configuration.duration, profile, timeouts, retry_policy, configuration.http2).run()
+        return None
+
+    if configuration.engine == "async" or configuration.http2:
+        '''
+            All users run on this thread's event loop, run() returns when they are done.
+        '''
+        AsyncRun(len(payloads), configuration.i, configuration.u, headers, payloads, configuration.connections, recordTestPoint, not configuration.new_connection, first_id, timeouts = timeouts, retry_policy = retry_policy, http2 = configuration.http2).run()
+        return None
+
+    runs = []
+    for i in range(len(payloads)):
+        run = ThreadRun(first_id + i, configuration.i, configuration.u, headers, payloads[i], configuration.new_connection, timeouts, retry_policy)
+        if result_store is not None:
+            result_store.buffer(run.id, configuration.i)
+        
+        # Start the worker thread.
+        run.start()
+        runs.append(run)
+
+    '''
+        Wait until all threads complete.
+    '''
+    for run in runs:
+        run.join()
+
+    return None
+
+def runSearch(configuration, headers):
+    '''
+        Run a saturation search in this process. Each stage is an open loop test
+        at the stage rate, or a closed loop async test with the stage number of 
+        users, for stage_duration seconds. Stage calls are also recorded in 
+        thread_recorders so they appear in the usual report.
+
+        Returns the search stats.
+    '''
+    timeouts = buildTimeouts(configuration)
+    retry_policy = buildRetryPolicy(configuration)
+
+    def runStage(target, stage_recorder):
+        def record(thread, status, elapsed, phases = None, kind = None, retries = 0):
+            recordTestPoint(thread, status, elapsed, phases, kind, retries)
+            stage_recorder.record(status, elapsed)
+
+        if configuration.search == "rate":
+            OpenLoopRun(
+                target, 
+                configuration.stage_duration, 
+                configuration.arrival, 
+                configuration.u, 
+                headers, 
+                buildPayloads(configuration, 1), 
+                configuration.connections, 
+                configuration.max_outstanding, 
+                configuration.late_ms / 1000.0, 
+                record, 
+                keep_alive = not configuration.new_connection,
+                timeouts = timeouts,
+                retry_policy = retry_policy,
+                http2 = configuration.http2).run()
+        else:
+            users = int(round(target))
+            AsyncRun(users, 0, configuration.u, headers, buildPayloads(configuration, users), configuration.connections, record, not configuration.new_connection, 1, configuration.stage_duration, None, timeouts, retry_policy, configuration.http2).run()
+
+    search = SaturationSearch(
+        runStage, 
+        configuration.search_start, 
+        configuration.search_step, 
+        configuration.search_stages, 
+        configuration.slo_p99_ms / 1000.0, 
+        configuration.error_budget)
+    return search.run()
+
+def runAdaptive(configuration, headers):
+    '''
+        Run an adaptive concurrency test in this process. adaptive_max users run 
+        on the async engine for duration seconds and the controller decides how
+        many of them are calling at any time. 
+
+        Returns the adaptive stats.
+    '''
+    controller = ConcurrencyController(
+        configuration.adaptive, 
+        configuration.slo_p99_ms / 1000.0, 
+        configuration.error_budget, 
+        configuration.adaptive_min, 
+        configuration.adaptive_max, 
+        configuration.adaptive_interval)
+
+    def record(thread, status, elapsed, phases = None, kind = None, retries = 0):
+        recordTestPoint(thread, status, elapsed, phases, kind, retries)
+        controller.record(status, elapsed)
+
+    users = controller.maximum
+    AsyncRun(
+        users, 
+        0, 
+        configuration.u, 
+        headers, 
+        buildPayloads(configuration, users), 
+        configuration.connections if configuration.http2 else users, 
+        record, 
+        not configuration.new_connection, 
+        1, 
+        configuration.duration, 
+        controller, 
+        buildTimeouts(configuration), 
+        buildRetryPolicy(configuration), 
+        configuration.http2).run()
+    return controller.getAdaptiveStatistics()
+
+def runLoadTestProcess(plan, result_queue):
+    '''
+        Entry point for a worker process started with -processes, one process
+        per plan. 
+
+        plan is [configuration, headers, users, first_id, rate, window_queue], 
+        the process runs its share of the test and puts its thread recorders, 
+        schedule stats and raw result columns (-raw only) on result_queue for 
+        the parent to merge, or the error if the test failed. When live metrics
+        are on, per second windows are sent to the parent through window_queue
+        as the test runs.
+    '''
+    global thread_recorders, result_store
+
+    try:
+        thread_recorders = {}
+        result_store = None
+        result_queue.put(runProcessPlan(plan))
+    except Exception as ex:
+        result_queue.put(Exception("Load test process failed : {}".format(ex)))
+
+def runProcessPlan(plan):
+    configuration, headers, users, first_id, rate, window_queue = plan
+
+    forwarder = None
+    if window_queue is not None:
+        forwarder = WindowForwarder(window_queue, thread_recorders)
+        forwarder.start()
+
+    schedule_stats = runLoadTest(configuration, headers, users, first_id, rate)
+
+    if forwarder:
+        forwarder.stop()
+    columns = result_store.columns() if result_store is not None else None
+    return [thread_recorders, schedule_stats, columns]
+
+
+def startLiveMetrics(configuration, collect = None, lag = COMPLETE_LAG):
+    '''
+        Start live metrics if -live or -timeseries was given, returns the 
+        LiveMetrics thread or None. By default the windows are collected from
+        thread_recorders in this process.
+    '''
+    if not (configuration.live or configuration.timeseries):
+        return None
+
+    if collect is None:
+        def collect(final):
+            return popWindows(list(thread_recorders.values()), None if final else int(time.time()) - 1)
+
+    live_metrics = LiveMetrics(collect, configuration.live, configuration.timeseries, lag)
+    live_metrics.start()
+    return live_metrics
+
+def splitUsers(users, parts):
+    '''
+        Split users as evenly as possible into parts, returns [first_user, count] 
+        for each part with first_user counted from 0.
+    '''
+    shares = []
+    first_user = 0
+    for part in range(parts):
+        count = users // parts
+        if part < users % parts:
+            count += 1
+        shares.append([first_user, count])
+        first_user += count
+    return shares
+
+def runCoordinator(coordinator, configuration):
+    '''
+        Hand each connected agent its share of the test, print interim results as 
+        agent summaries arrive and merge the final summaries into thread_recorders. 
+        Threads are reported as agent-thread.
+
+        Returns the merged open loop schedule stats, or None for a closed loop test.
+    '''
+    global thread_recorders
+
+    '''
+        Agents run the test with the coordinator's arguments, splitting users 
+        or rate the same way -processes does. A corpus file is opened by each 
+        agent so it must exist at the same path on the agent machines.
+    '''
+    arguments = dict(vars(configuration))
+    arguments["role"] = "standalone"
+    arguments["processes"] = 1
+    plans = []
+    for first_user, users in splitUsers(configuration.t, configuration.agents):
+        plan = {}
+        plan["arguments"] = arguments
+        plan["headers"] = api_headers
+        plan["users"] = users
+        plan["rate"] = configuration.rate / configuration.agents if configuration.rate > 0 else 0
+        plans.append(plan)
+
+    start_time = time.time()
+    interim = {}
+
+    def reportInterim(message):
+        if message["final"]:
+            return
+        interim[message["agent"]] = LatencyRecorder.fromDict(message["recorder"])
+        merged = LatencyRecorder()
+        for agent_id in interim.keys():
+            merged.merge(interim[agent_id])
+        print("Interim : agents = {} calls = {} errors = {} rps = {:.1f} p50 = {} p99 = {}".format(
+            len(interim), 
+            merged.calls(), 
+            merged.errors, 
+            merged.calls() / max(time.time() - start_time, 0.001),
+            merged.histogram.percentile(50),
+            merged.histogram.percentile(99)))
+
+    coordinator.sendPlans(plans)
+    finals = coordinator.collect(reportInterim)
+    coordinator.close()
+
+    for final in finals:
+        for thread_id in final["recorders"].keys():
+            thread_recorders["{}-{}".format(final["agent"], thread_id)] = LatencyRecorder.fromDict(final["recorders"][thread_id])
+
+    return mergeScheduleStatistics([final["schedule"] for final in finals])
+
+def runAgent(configuration):
+    '''
+        Connect to the coordinator, run the plan it sends and stream summaries
+        back every report_interval seconds until the test completes.
+    '''
+    agent = Agent(configuration.host, configuration.port)
+    plan = agent.receivePlan()
+    print("Agent", agent.agent_id, "received plan for", plan["arguments"]["u"])
+
+    plan_configuration = argparse.Namespace(**plan["arguments"])
+    schedule_stats = []
+
+    live_metrics = startLiveMetrics(plan_configuration)
+    worker = Thread(target = lambda: schedule_stats.append(runLoadTest(plan_configuration, plan["headers"], plan["users"], 1, plan["rate"])))
+    worker.start()
+    while worker.is_alive():
+        worker.join(configuration.report_interval)
+        if worker.is_alive():
+            snapshot = LatencyRecorder()
+            for recorder in list(thread_recorders.values()):
+                snapshot.merge(recorder.copy())
+            agent.sendSummary(snapshot)
+
+    if live_metrics:
+        live_metrics.stop()
+    agent.sendFinal(thread_recorders, schedule_stats[0] if schedule_stats else None)
+    agent.close()
+
+def printReport(configuration, total_seconds, schedule_stats, search_stats = None, adaptive_stats = None):
+    '''
+        Get and print out the statistics for this run. 
+    '''
+    stats = getThreadStatistics()
+    print("Global Stats:")
+    print("     Total Time  : ", total_seconds )
+    print("     Overall RPS : ", stats[0]["calls"] / total_seconds )
+    print("     Batch Size  : ", configuration.batch_size )
+    print("     Records/sec : ", stats[0]["success"] * configuration.batch_size / total_seconds )
+    print("     Connections : ", "new per call" if configuration.new_connection else "keep-alive" )
+    print("     Processes   : ", configuration.processes )
+    if configuration.role == "coordinator":
+        print("     Agents      : ", configuration.agents )
+    dumpStats(stats[0])
+    kind_stats = getKindStatistics()
+    for kind in kind_stats.keys():
+        print("Outcome", kind, "Stats:")
+        dumpStats(kind_stats[kind])
+    phase_stats = getPhaseStatistics()
+    for phase in phase_stats.keys():
+        print("Phase", phase, "Stats:")
+        dumpStats(phase_stats[phase])
+    for status in sorted(stats[2].keys()):
+        print("Status", status, "Stats:")
+        dumpStats(stats[2][status])
+    if schedule_stats:
+        print("Schedule Stats:")
+        dumpStats(schedule_stats)
+    if search_stats:
+        print("Search Stats:")
+        dumpStats(search_stats)
+    if adaptive_stats:
+        print("Adaptive Stats:")
+        dumpStats(adaptive_stats)
+    for thread_id in stats[1].keys():
+        print("Thread", thread_id, "Stats:")
+        dumpStats(stats[1][thread_id])
 
 
 '''
@@ -175,54 +903,148 @@ class ThreadRun(Thread):
 
     This can be used for any number of AMLS endpoints, with the real change being to the payload that is set 
     into the thread class to perform the execution. 
-'''
 
+    With -processes the users (or the open loop rate) are split across that many worker processes
+    so the test is not limited to the one core a single Python process can use. Each process runs 
+    the same loop as above and the parent merges their thread recorders. 
 
+    With -role coordinator the test is run by agents (-role agent), possibly on other machines, 
+    and the coordinator merges the results they send back. 
 '''
-    Using the configuration, fire up as many threads as we need. 
-'''
-configuration = loadArguments(sys.argv[1:])   
-names = ["Dave", "Sue", "Dan", "Joe", "Beth"]
-
-# Capture the start time.
-start_time = datetime.now()
-
-for i in range(configuration.t):
-    payload = {'name' : names[random.randint(0, len(names) -1)]}
-    run = ThreadRun(i+1, configuration.i, configuration.u, api_headers, payload)
-    
-    # Increase the thread counter
-    test_collection_lock.acquire()
-    running_threads += 1
-    test_collection_lock.release()
-    
-    # Start the worker thread.
-    run.start()
+if __name__ == "__main__":
 
-'''
-    Wait until all threads complete.
-'''
-counter = 0
-while running_threads > 0:
-    counter += 1
-    if counter %3 == 0:
-        print("Waiting on threads, current count =", running_threads)
-    time.sleep(.5)
-
-# Capture the start time.
-end_time = datetime.now()
-total_seconds = (end_time - start_time).total_seconds()
-print(total_seconds)
+    '''
+        Using the configuration, fire up as many threads (or coroutines) as we need. 
+    '''
+    configuration = loadArguments(sys.argv[1:])   
 
-'''
-    Get and print out the statistics for this run. 
-'''
-stats = getThreadStatistics()
-print("Global Stats:")
-print("     Total Time  : ", total_seconds )
-print("     Overall RPS : ", stats[0]["calls"] / total_seconds )
-dumpStats(stats[0])
-for thread_id in stats[1].keys():
-    print("Thread", thread_id, "Stats:")
-    dumpStats(stats[1][thread_id])
+    if configuration.role == "agent":
+        runAgent(configuration)
+        sys.exit(0)
+
+    if configuration.role == "coordinator":
+        coordinator = Coordinator(configuration.host, configuration.port, configuration.agents)
+        print("Waiting for", configuration.agents, "agents on", configuration.host, configuration.port)
+        coordinator.waitForAgents()
+
+    # Capture the start time.
+    start_time = datetime.now()
+
+    search_stats = None
+    adaptive_stats = None
+    if configuration.search != "none":
+        '''
+            The search runs its stages one after another in this process.
+        '''
+        schedule_stats = None
+        search_stats = runSearch(configuration, api_headers)
+    elif configuration.adaptive != "none":
+        '''
+            One controller sees every call, so the adaptive test runs in this process.
+        '''
+        schedule_stats = None
+        live_metrics = startLiveMetrics(configuration)
+        adaptive_stats = runAdaptive(configuration, api_headers)
+        if live_metrics:
+            live_metrics.stop()
+    elif configuration.role == "coordinator":
+        schedule_stats = runCoordinator(coordinator, configuration)
+    elif configuration.processes > 1:
+        '''
+            Split the users as evenly as possible, thread ids stay unique across 
+            processes. An open loop test gives each process an equal share of the rate.
+
+            Live metric windows from the processes arrive on a managed queue.
+        '''
+        window_queue = None
+        live_metrics = None
+        if configuration.live or configuration.timeseries:
+            window_queue = multiprocessing.Manager().Queue()
+
+            def collectQueue(final):
+                windows = {}
+                while not window_queue.empty():
+                    message = window_queue.get()
+                    for second in message.keys():
+                        window = LatencyRecorder.fromDict(message[second])
+                        if second in windows:
+                            windows[second].merge(window)
+                        else:
+                            windows[second] = window
+                return windows
+            live_metrics = startLiveMetrics(configuration, collectQueue, COMPLETE_LAG + 1)
+
+        plans = []
+        shares = splitUsers(configuration.t, configuration.processes)
+        for process in range(configuration.processes):
+            first_user, users = shares[process]
+            if configuration.rate > 0:
+                plans.append([configuration, api_headers, 1, process + 1, configuration.rate / configuration.processes, window_queue])
+            elif users > 0:
+                plans.append([configuration, api_headers, users, first_user + 1, 0, window_queue])
+
+        result_queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target = runLoadTestProcess, args = (plan, result_queue)) for plan in plans]
+        for process in processes:
+            process.start()
+
+        '''
+            Results are read before the processes are joined, a process does not 
+            exit until its (possibly large) result has been read from the queue.
+        '''
+        results = []
+        while len(results) < len(plans):
+            try:
+                result = result_queue.get(timeout = 1)
+            except queue.Empty:
+                if not [process for process in processes if process.is_alive()]:
+                    raise Exception("A load test process exited without a result")
+                continue
+            if isinstance(result, Exception):
+                raise result
+            results.append(result)
+        for process in processes:
+            process.join()
+
+        if live_metrics:
+            live_metrics.stop()
+
+        for result in results:
+            thread_recorders.update(result[0])
+            if result[2] is not None:
+                if result_store is None:
+                    result_store = ResultStore()
+                result_store.extend(result[2])
+        schedule_stats = mergeScheduleStatistics([result[1] for result in results])
+    else:
+        live_metrics = startLiveMetrics(configuration)
+        schedule_stats = runLoadTest(configuration, api_headers, configuration.t, 1, configuration.rate)
+        if live_metrics:
+            live_metrics.stop()
+
+    # Capture the start time.
+    end_time = datetime.now()
+    total_seconds = (end_time - start_time).total_seconds()
+    print(total_seconds)
+
+    printReport(configuration, total_seconds, schedule_stats, search_stats, adaptive_stats)
+
+    if configuration.archive:
+        if result_store is None:
+            print("No raw calls were kept for this run, archive not saved")
+        else:
+            '''
+                Archives are shared and kept as baselines, so the endpoint key is left out.
+            '''
+            arguments = dict(vars(configuration))
+            arguments.pop("k", None)
+            saveArchive(configuration.archive, result_store.columns(), arguments, total_seconds)
+            print("Run archived to", configuration.archive)
 
+    if adaptive_stats and configuration.adaptive_expect > 0:
+        if not adaptive_stats["converged"]:
+            print("Adaptive controller did not converge, run for longer to check for", configuration.adaptive_expect)
+            sys.exit(1)
+        if adaptive_stats["settled_concurrency"] < configuration.adaptive_expect:
+            print("Settled concurrency is below", configuration.adaptive_expect)
+            sys.exit(1)
@@ -0,0 +1,398 @@
+'''
+    Local stand in for a deployed Real Time Scoring service.
+
+    Read the function loadArguments() to determine what parameters to pass in.
+
+    The service speaks the same contract as the AML endpoint so rtsloadtest.py can be
+    pointed at it without a live AKS cluster:
+
+        POST /score (or any path ending in /score, i.e. /api/v1/service/[name]/score)
+            Authorization: Bearer [key]     - required when -k is set, 401 otherwise
+            Body                            - passed as a string to run()
+            Response                        - run()'s return value, JSON encoded, or
+                                              the body, status and headers of an 
+                                              AMLResponse
+            Content-Type: application/x-ndjson - The body is read whole, then passed
+                                              to run() as a request with a stream to
+                                              read, as the container does with 
+                                              SCORING_STREAMING=1. A streamed response
+                                              is sent chunked as run() produces it 
+                                              (HTTP/2 responses are sent whole)
+
+        GET /  - Health check, returns "Healthy"
+        GET /metrics - The scoring script's metrics(), if it has one (i.e. the
+                       micro batcher, response cache and phase timer metrics)
+        GET /metrics/prometheus - The scoring script's prometheusMetrics(), if
+                       it has one (phase timer histograms)
+        GET /status  - The scoring script's status(), if it has one (model 
+                       readiness and init timings)
+
+    The scoring script (default paths/realtime/scoring/scoring.py) is loaded and init()
+    is called once per process, exactly as the container does.
+
+    To separate client limits from server limits, latency can be added to every call
+    from a distribution and calls can be failed at a set rate:
+
+        latency     = none (default), fixed, uniform, normal, lognormal or exponential
+        latency_ms  = Mean latency in milliseconds (uniform is 0 to 2 x latency_ms)
+        latency_sd_ms = Standard deviation in milliseconds for normal and lognormal
+
+    Latency is an asyncio sleep, so like a real service waiting on a model it does not
+    use CPU and many calls can wait at once. -max_concurrent limits how many calls are
+    scored at a time, the rest queue as they would on a busy container.
+
+    run() is called on the event loop, one call at a time. With -workers it is
+    called from a pool of that many threads instead, so calls reach run() 
+    concurrently as they do on a container with several workers (needed for
+    the scoring script's micro batcher to see concurrent calls).
+
+    With -processes the service runs that many processes sharing the port (Linux
+    SO_REUSEPORT) so it can out run the load generator being measured.
+
+    If the h2 package is installed (it comes with httpx[http2]) the service also 
+    answers HTTP/2 without TLS (h2c prior knowledge), so rtsloadtest.py -http2 can
+    be compared with HTTP/1.1 against the same service.
+'''
+import sys
+import argparse
+import asyncio
+import http.client
+import importlib.util
+import io
+import json
+import math
+import multiprocessing
+import random
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:
+    h2 = None
+
+# Content type of streamed (newline delimited JSON) requests
+NDJSON = "application/x-ndjson"
+
+# First line of the HTTP/2 connection preface
+HTTP2_PREFACE_START = b"PRI * HTTP/2.0\r\n"
+
+
+def loadArguments(sys_args):
+    '''
+        host = Address to listen on.
+        port = Port to listen on.
+        k = Key callers must send as a bearer token, no key check when empty.
+        scoring = Path to the scoring script providing init() and run().
+        latency = Added latency distribution: none, fixed, uniform, normal, lognormal
+                  or exponential.
+        latency_ms = Mean added latency in milliseconds.
+        latency_sd_ms = Standard deviation of added latency in milliseconds (normal and
+                        lognormal).
+        error_rate = Fraction of calls failed with a 500.
+        throttle_rate = Fraction of calls rejected with a 503, as a busy service does.
+        max_concurrent = Calls scored at the same time per process, 0 for no limit.
+        processes = Number of service processes sharing the port.
+        workers = Threads calling run() per process, 0 calls run() on the event loop.
+    '''
+    parser = argparse.ArgumentParser(description='Local scoring service.')
+    parser.add_argument("-host", required=False, default="127.0.0.1", type=str, help="Listen address")
+    parser.add_argument("-port", required=False, default=8080, type=int, help="Listen port")
+    parser.add_argument("-k", required=False, default="", type=str, help="Service key")
+    parser.add_argument("-scoring", required=False, default="paths/realtime/scoring/scoring.py", type=str, help="Scoring script")
+    parser.add_argument("-latency", required=False, default="none", choices=["none", "fixed", "uniform", "normal", "lognormal", "exponential"], type=str, help="Added latency distribution")
+    parser.add_argument("-latency_ms", required=False, default=0, type=float, help="Mean added latency in milliseconds")
+    parser.add_argument("-latency_sd_ms", required=False, default=0, type=float, help="Added latency standard deviation in milliseconds")
+    parser.add_argument("-error_rate", required=False, default=0, type=float, help="Fraction of calls failed with 500")
+    parser.add_argument("-throttle_rate", required=False, default=0, type=float, help="Fraction of calls rejected with 503")
+    parser.add_argument("-max_concurrent", required=False, default=0, type=int, help="Calls scored at once per process")
+    parser.add_argument("-processes", required=False, default=1, type=int, help="Service process count")
+    parser.add_argument("-workers", required=False, default=0, type=int, help="Threads calling run() per process")
+
+    return parser.parse_args(sys_args)
+
+def loadScoringModule(file_name):
+    '''
+        Load the scoring script the way the container does, from its file, and call init()
+    '''
+    spec = importlib.util.spec_from_file_location("scoring", file_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.init()
+    return module
+
+
+class LatencyModel:
+    '''
+        Added latency in seconds drawn from the configured distribution.
+    '''
+    def __init__(self, kind, mean_ms, sd_ms):
+        self.kind = kind
+        self.mean = mean_ms / 1000.0
+        self.sd = sd_ms / 1000.0
+
+        if kind == "lognormal" and self.mean > 0:
+            '''
+                Parameters of the underlying normal for the requested mean and
+                standard deviation.
+            '''
+            variance = math.log(1 + (self.sd * self.sd) / (self.mean * self.mean))
+            self.mu = math.log(self.mean) - variance / 2
+            self.sigma = math.sqrt(variance)
+
+    def next(self):
+        if self.kind == "none" or self.mean <= 0:
+            return 0
+        if self.kind == "fixed":
+            return self.mean
+        if self.kind == "uniform":
+            return random.uniform(0, 2 * self.mean)
+        if self.kind == "normal":
+            return max(random.gauss(self.mean, self.sd), 0)
+        if self.kind == "lognormal":
+            return random.lognormvariate(self.mu, self.sigma)
+        return random.expovariate(1 / self.mean)
+
+
+class StreamRequest:
+    '''
+        Stand in for the HTTP request the container passes run() when the 
+        scoring script asks for it, for application/x-ndjson bodies.
+    '''
+    def __init__(self, content_type, body):
+        self.headers = {"Content-Type" : content_type}
+        self.body = body
+        self.stream = io.BytesIO(body)
+
+    def get_data(self, as_text = False):
+        return self.body.decode("utf-8") if as_text else self.body
+
+
+class ScoringService:
+    '''
+        Minimal HTTP/1.1 keep-alive server in front of a scoring module.
+    '''
+    def __init__(self, configuration, scoring):
+        self.configuration = configuration
+        self.scoring = scoring
+        self.latency = LatencyModel(configuration.latency, configuration.latency_ms, configuration.latency_sd_ms)
+        self.authorization = "Bearer " + configuration.k if configuration.k else None
+        self.semaphore = None
+        if configuration.max_concurrent > 0:
+            self.semaphore = asyncio.Semaphore(configuration.max_concurrent)
+        self.executor = None
+        if configuration.workers > 0:
+            self.executor = ThreadPoolExecutor(configuration.workers)
+
+    async def handle(self, reader, writer):
+        '''
+            Serve requests on one connection until the client closes it
+        '''
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                if request_line == HTTP2_PREFACE_START:
+                    await self.handleHttp2(reader, writer, request_line + await reader.readexactly(8))
+                    break
+                method, path, version = request_line.decode("latin-1").split(None, 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                body = b""
+                if "content-length" in headers:
+                    body = await reader.readexactly(int(headers["content-length"]))
+
+                status, response, response_headers = await self.respond(method, path.split("?", 1)[0], headers, body)
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version.strip() == "HTTP/1.1"
+                streamed = not isinstance(response, bytes)
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: {}\r\n{}{}\r\nConnection: {}\r\n\r\n".format(
+                    status,
+                    http.client.responses.get(status, "Unknown"),
+                    response_headers.pop("Content-Type", "application/json"),
+                    "".join(["{}: {}\r\n".format(key, value) for key, value in response_headers.items()]),
+                    "Transfer-Encoding: chunked" if streamed else "Content-Length: {}".format(len(response)),
+                    "keep-alive" if keep_alive else "close").encode("latin-1") + (b"" if streamed else response))
+                if streamed:
+                    for chunk in response:
+                        if chunk:
+                            writer.write("{:x}\r\n".format(len(chunk)).encode("latin-1") + chunk + b"\r\n")
+                            await writer.drain()
+                    writer.write(b"0\r\n\r\n")
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handleHttp2(self, reader, writer, preface):
+        '''
+            Serve an HTTP/2 (h2c prior knowledge) connection, every stream is 
+            answered by its own task so calls on a connection run concurrently.
+        '''
+        if h2 is None:
+            return
+
+        connection = h2.connection.H2Connection(config = h2.config.H2Configuration(client_side = False, header_encoding = "utf-8"))
+        connection.initiate_connection()
+        streams = {}
+        window_open = asyncio.Event()
+
+        async def answer(stream_id, headers, body):
+            status, response, response_headers = await self.respond(headers.get(":method"), headers.get(":path", "").split("?", 1)[0], headers, body)
+            if not isinstance(response, bytes):
+                response = b"".join(response)
+            content_type = response_headers.pop("Content-Type", "application/json")
+            connection.send_headers(stream_id, [(":status", str(status)), ("content-type", content_type), ("content-length", str(len(response)))] +
+                [(key.lower(), value) for key, value in response_headers.items()])
+            while True:
+                size = min(connection.local_flow_control_window(stream_id), connection.max_outbound_frame_size, len(response))
+                if size == 0 and len(response) > 0:
+                    writer.write(connection.data_to_send())
+                    window_open.clear()
+                    await window_open.wait()
+                    continue
+                connection.send_data(stream_id, response[:size], end_stream = size == len(response))
+                response = response[size:]
+                if len(response) == 0:
+                    break
+            writer.write(connection.data_to_send())
+
+        data = preface
+        while data:
+            for event in connection.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    streams[event.stream_id] = [{key.lower() : value for key, value in event.headers}, []]
+                elif isinstance(event, h2.events.DataReceived):
+                    streams[event.stream_id][1].append(event.data)
+                    connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    headers, chunks = streams.pop(event.stream_id)
+                    asyncio.ensure_future(answer(event.stream_id, headers, b"".join(chunks)))
+                elif isinstance(event, h2.events.WindowUpdated):
+                    window_open.set()
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    return
+            writer.write(connection.data_to_send())
+            data = await reader.read(65536)
+
+    async def respond(self, method, path, headers, body):
+        '''
+            Returns [status, response body bytes, response headers]
+        '''
+        if method == "GET" and path == "/":
+            return [200, b'"Healthy"', {}]
+        if method == "GET" and path == "/metrics":
+            if not hasattr(self.scoring, "metrics"):
+                return [404, b'"Not Found"', {}]
+            return [200, json.dumps(self.scoring.metrics()).encode("utf-8"), {}]
+        if method == "GET" and path == "/metrics/prometheus":
+            if not hasattr(self.scoring, "prometheusMetrics"):
+                return [404, b'"Not Found"', {}]
+            return [200, self.scoring.prometheusMetrics().encode("utf-8"), {"Content-Type" : "text/plain; version=0.0.4"}]
+        if method == "GET" and path == "/status":
+            if not hasattr(self.scoring, "status"):
+                return [404, b'"Not Found"', {}]
+            return [200, json.dumps(self.scoring.status()).encode("utf-8"), {}]
+        if method != "POST" or not path.endswith("/score"):
+            return [404, b'"Not Found"', {}]
+        if self.authorization and headers.get("authorization") != self.authorization:
+            return [401, b'"Unauthorized"', {}]
+
+        configuration = self.configuration
+        draw = random.random()
+        if draw < configuration.throttle_rate:
+            return [503, b'"Service Unavailable"', {}]
+
+        if self.semaphore:
+            async with self.semaphore:
+                return await self.score(body, headers, draw - configuration.throttle_rate < configuration.error_rate)
+        return await self.score(body, headers, draw - configuration.throttle_rate < configuration.error_rate)
+
+    async def score(self, body, headers, fail):
+        delay = self.latency.next()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if fail:
+            return [500, json.dumps({"error" : "Injected failure"}).encode("utf-8"), {}]
+        try:
+            if headers.get("content-type", "").startswith(NDJSON):
+                data = StreamRequest(headers["content-type"], body)
+            else:
+                data = body.decode("utf-8")
+
+            if self.executor:
+                result = await asyncio.get_event_loop().run_in_executor(self.executor, self.scoring.run, data)
+            else:
+                result = self.scoring.run(data)
+            if getattr(result, "is_streamed", False):
+                return [result.status_code, result.iter_encoded(), dict(result.headers)]
+            if hasattr(result, "get_data"):
+                return [result.status_code, result.get_data(), dict(result.headers)]
+            return [200, json.dumps(result).encode("utf-8"), {}]
+        except Exception as ex:
+            return [500, json.dumps({"error" : str(ex)}).encode("utf-8"), {}]
+
+
+def runService(configuration):
+    '''
+        Run one service process until it is interrupted.
+    '''
+    scoring = loadScoringModule(configuration.scoring)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    service = ScoringService(configuration, scoring)
+    server = loop.run_until_complete(loop.create_server(
+        lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader(loop = loop), service.handle, loop = loop),
+        configuration.host,
+        configuration.port,
+        reuse_port = configuration.processes > 1))
+    try:
+        loop.run_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.close()
+        loop.close()
+
+
+'''
+    Program Code:
+
+    Start the configured number of service processes and serve until interrupted (Ctrl+C).
+'''
+if __name__ == "__main__":
+
+    configuration = loadArguments(sys.argv[1:])
+
+    print("Scoring service on http://{}:{}/score".format(configuration.host, configuration.port))
+    if configuration.processes > 1:
+        '''
+            Stopping the parent, with Ctrl+C or a terminate, stops every process.
+        '''
+        signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+        processes = [multiprocessing.Process(target = runService, args = (configuration,)) for i in range(configuration.processes)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except (KeyboardInterrupt, SystemExit):
+            for process in processes:
+                process.terminate()
+                process.join()
+    else:
+        runService(configuration)
@@ -378,7 +378,7 @@ def createImage(workspace, scoring_file, model, image_name, job_log = None ):
     '''
     
     conda_pack = []
-    requirements = ["azureml-defaults==1.0.57", "azureml-contrib-services"]
+    requirements = ["azureml-defaults==1.0.57", "azureml-contrib-services", "orjson==3.6.1"]
 
     reportStatus(job_log, "Creating container image {}".format(image_name))
 